@@ -0,0 +1,30 @@
+import numpy as np
+
+
+class BufferPool:
+    """
+    Reusable destination arrays for the OpenCV pipeline (dst= parameters).
+    Each named buffer is kept for the last shape it was requested with, so a
+    stream with a stable resolution allocates once and then only reuses.
+    Not thread-safe: use one pool per worker thread.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.reuses = 0
+
+    def get(self, name: str, shape, dtype=np.uint8) -> np.ndarray:
+        shape = tuple(shape)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        else:
+            self.reuses += 1
+        return buffer
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers.values())
@@ -0,0 +1,201 @@
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass(eq=False)
+class Track:
+    track_id: int
+    corners: np.ndarray                     # (4, 2) TL, TR, BR, BL
+    label: Optional[str] = None             # confirmed label (after voting)
+    conf: float = 0.0                       # mean confidence of the confirmed label's votes
+    vote_count: int = 0                     # votes of the confirmed label in the window
+    votes: deque = field(default_factory=deque)  # recent (label, conf) classifications
+    classified_at: Optional[int] = None     # frame index of the last classification
+    classified_centroid: Optional[np.ndarray] = None
+    attempts: int = 0                       # classifications since it was placed or last moved
+    missed: int = 0
+
+    @property
+    def box(self):
+        x1, y1 = self.corners.min(axis=0)
+        x2, y2 = self.corners.max(axis=0)
+        return x1, y1, x2, y2
+
+    @property
+    def centroid(self):
+        return self.corners.mean(axis=0)
+
+    @property
+    def area(self):
+        x, y = self.corners[:, 0], self.corners[:, 1]
+        return float(0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1))))
+
+    @property
+    def size(self):
+        x1, y1, x2, y2 = self.box
+        return float(np.hypot(x2 - x1, y2 - y1))
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class CardTracker:
+    """
+    Gives the cards of a game stable track IDs across frames, matching the
+    quads of four_corners_set by box IoU (or centroid distance as fallback).
+    The label of each track is cached, so a card only goes back to the
+    classifier when it is new, has moved, has no confirmed label yet, or its
+    label is older than refresh_frames.
+
+    A label is only confirmed after min_votes agreeing classifications within
+    the last vote_window ones, or once their summed confidence reaches
+    min_total_conf, so a single misread frame never reaches the referee.
+    A track that gets no label after max_attempts classifications (a face-down
+    pile, a card-like box) is treated like a labelled one until it moves.
+    When a classification disagrees with the confirmed label (e.g. a card
+    swapped in at the same spot), the track is voted on again every frame
+    until the window settles, within max_attempts.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_dist=0.5, move_threshold=0.1,
+                 refresh_frames=90, max_missed=5, vote_window=5, min_votes=3, min_total_conf=1.9,
+                 max_attempts=10):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_dist = max_centroid_dist  # fraction of the card diagonal
+        self.move_threshold = move_threshold        # fraction of the card diagonal
+        self.refresh_frames = refresh_frames
+        self.max_missed = max_missed
+        self.vote_window = vote_window
+        self.min_votes = min_votes
+        self.min_total_conf = min_total_conf
+        self.max_attempts = max_attempts
+        self.tracks: list = []
+        self.frame_index = 0
+        self._ids = count()
+
+    def update(self, four_corners_set) -> list:
+        """
+        Matches the detected quads to the existing tracks.
+        Returns one Track per quad, in the same order.
+        """
+        self.frame_index += 1
+        quads = [np.asarray(corners, dtype=np.float32).reshape(4, 2) for corners in four_corners_set]
+
+        # Candidate (score, track, quad) pairs, best first
+        candidates = []
+        for t, track in enumerate(self.tracks):
+            track_box, track_centroid, track_size = track.box, track.centroid, track.size
+            for q, quad in enumerate(quads):
+                quad_box = (*quad.min(axis=0), *quad.max(axis=0))
+                iou = box_iou(track_box, quad_box)
+                if iou >= self.iou_threshold:
+                    candidates.append((1.0 + iou, t, q))
+                    continue
+                dist = float(np.linalg.norm(quad.mean(axis=0) - track_centroid))
+                if track_size > 0 and dist <= self.max_centroid_dist * track_size:
+                    candidates.append((1.0 - dist / track_size, t, q))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        matched_tracks, result = set(), [None] * len(quads)
+        for _, t, q in candidates:
+            if t in matched_tracks or result[q] is not None:
+                continue
+            track = self.tracks[t]
+            track.corners = quads[q]
+            track.missed = 0
+            matched_tracks.add(t)
+            result[q] = track
+
+        # New tracks for unmatched quads
+        known = len(self.tracks)
+        for q, quad in enumerate(quads):
+            if result[q] is None:
+                track = Track(track_id=next(self._ids), corners=quad, votes=deque(maxlen=self.vote_window))
+                self.tracks.append(track)
+                result[q] = track
+
+        # Age unmatched tracks and drop the lost ones
+        for t, track in enumerate(self.tracks[:known]):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        return result
+
+    def needs_classification(self, track: Track) -> bool:
+        """
+        True if the track is new, moved, not confirmed yet or disputed by its
+        latest vote (and still within max_attempts) or stale.
+        """
+        if track.classified_at is None or self.is_pending(track):
+            return True
+        if self.frame_index - track.classified_at >= self.refresh_frames:
+            return True
+        return self.has_moved(track)
+
+    def has_moved(self, track: Track) -> bool:
+        moved = float(np.linalg.norm(track.centroid - track.classified_centroid))
+        return moved > self.move_threshold * track.size
+
+    def is_pending(self, track: Track) -> bool:
+        """
+        True if the track has no label yet, or its latest vote disagrees with
+        the confirmed one, and it is still worth voting on.
+        """
+        if track.attempts >= self.max_attempts:
+            return False
+        return track.label is None or track.votes[-1][0] != track.label
+
+    def add_vote(self, track: Track, label: Optional[str], conf: float):
+        """
+        Records a classification of the track and confirms the best label of
+        the window once it has enough votes (or enough summed confidence).
+        """
+        if track.classified_centroid is not None and self.has_moved(track):
+            track.attempts = 0  # Moved: a fresh budget of attempts
+        elif track.label is not None and label != track.label and track.votes[-1][0] == track.label:
+            track.attempts = 0  # First vote against the confirmed label: a fresh budget to settle it
+        track.attempts += 1
+        track.classified_at = self.frame_index
+        track.classified_centroid = track.centroid
+        track.votes.append((label, conf))
+
+        totals = {}
+        for vote_label, vote_conf in track.votes:
+            if vote_label is not None:
+                votes, total = totals.get(vote_label, (0, 0.0))
+                totals[vote_label] = (votes + 1, total + vote_conf)
+
+        for vote_label, (votes, total) in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+            if votes >= self.min_votes or total >= self.min_total_conf:
+                track.label = vote_label
+                track.conf = total / votes
+                track.vote_count = votes
+                break
+
+    def card_area(self) -> Optional[float]:
+        """
+        Median area of the tracked cards, or None without tracks.
+        """
+        if not self.tracks:
+            return None
+        return float(np.median([track.area for track in self.tracks]))
+
+    def has_unconfirmed(self) -> bool:
+        """
+        True if some track is still waiting for enough votes or settling a
+        disputed label (within max_attempts).
+        """
+        return any(self.is_pending(track) for track in self.tracks)
+
+    def reset(self):
+        self.tracks = []
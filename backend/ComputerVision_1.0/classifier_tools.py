@@ -0,0 +1,228 @@
+"""
+Ferramentas de linha de comando para o CardClassifier.
+
+    python classifier_tools.py parity --images <pasta de cartas recortadas>
+    python classifier_tools.py quantize --calibration <pasta de cartas recortadas> [--eval-images <pasta>]
+    python classifier_tools.py evaluate --images <pasta com subpastas por label>
+
+As pastas de avaliação seguem o formato do dataset de classificação do
+ultralytics: <pasta>/<label>/*.jpg (ex.: dataset_split/val).
+"""
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from yolo import BACKENDS, CONF_THRESHOLD, OnnxBackend
+
+DEFAULT_WEIGHTS = "./runs/classify/sueca_cards_classifier/weights/best.pt"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_images(folder, limit=None):
+    """
+    Loads the card crops of a folder (recursive). Returns (paths, images).
+    """
+    paths = sorted(
+        path for path in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in paths]
+    return paths, images
+
+
+def load_labelled_images(folder, limit=None):
+    """
+    Loads a <folder>/<label>/*.jpg dataset. Returns (labels, images).
+    """
+    paths, images = load_images(folder, limit)
+    labels = [os.path.basename(os.path.dirname(path)) for path in paths]
+    return labels, images
+
+
+def random_cards(count, seed=0):
+    """
+    Synthetic 200x280 crops, used when no image folder is given.
+    """
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (280, 200, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def predict_in_batches(backend, images, batch_size=32):
+    return np.concatenate([
+        backend.predict(images[i:i + batch_size]) for i in range(0, len(images), batch_size)
+    ])
+
+
+def parity(args):
+    """
+    Compares the probabilities of two backends over the same images.
+    """
+    if args.images:
+        _, images = load_images(args.images, args.limit)
+    else:
+        images = random_cards(args.limit or 64)
+    if not images:
+        print(f"[Parity] No images found in {args.images}")
+        return 1
+
+    reference = BACKENDS[args.reference](args.weights)
+    candidate = BACKENDS[args.candidate](args.weights)
+    ref_probs = predict_in_batches(reference, images)
+    cand_probs = predict_in_batches(candidate, images)
+
+    agreement = float(np.mean(ref_probs.argmax(1) == cand_probs.argmax(1)))
+    max_diff = float(np.abs(ref_probs - cand_probs).max())
+
+    print(f"[Parity] {args.reference} vs {args.candidate} on {len(images)} images")
+    print(f"[Parity] Top-1 agreement: {agreement:.2%}")
+    print(f"[Parity] Max probability difference: {max_diff:.5f}")
+
+    ok = agreement >= args.min_agreement and max_diff <= args.tolerance
+    print("[Parity] OK" if ok else "[Parity] FAILED")
+    return 0 if ok else 1
+
+
+def quantize(args):
+    """
+    Post-training static INT8 quantization of the ONNX classifier,
+    calibrated on a folder of flattened card crops.
+    """
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+
+    _, images = load_images(args.calibration, args.limit)
+    if not images:
+        print(f"[Quantize] No calibration images found in {args.calibration}")
+        return 1
+
+    onnx_path = OnnxBackend.export(args.weights)
+    int8_path = OnnxBackend.quantized_path(onnx_path)
+    input_name = onnx.load(onnx_path).graph.input[0].name
+
+    class CardCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(
+                {input_name: OnnxBackend.preprocess(images[i:i + 16])} for i in range(0, len(images), 16)
+            )
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    print(f"[Quantize] Calibrating on {len(images)} images...")
+    quantize_static(
+        onnx_path, int8_path, CardCalibrationReader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8
+    )
+
+    # Keep the class names (and other ultralytics metadata) in the INT8 model
+    fp32_model = onnx.load(onnx_path)
+    int8_model = onnx.load(int8_path)
+    onnx.helper.set_model_props(int8_model, {prop.key: prop.value for prop in fp32_model.metadata_props})
+    onnx.save(int8_model, int8_path)
+    print(f"[Quantize] Saved {int8_path}")
+
+    if args.eval_images:
+        gate_args = argparse.Namespace(
+            weights=args.weights, images=args.eval_images, limit=None,
+            reference="onnx", candidate="onnx_int8", max_accuracy_drop=args.max_accuracy_drop
+        )
+        if evaluate(gate_args) != 0:
+            os.remove(int8_path)
+            print(f"[Quantize] Refused: removed {int8_path}")
+            return 1
+    return 0
+
+
+def confidence_report(name, probs, labels, names):
+    """
+    Top-1 accuracy and confidence distribution of one model.
+    """
+    top1 = probs.argmax(1)
+    conf = probs.max(1)
+    predicted = [names[int(i)] for i in top1]
+    accuracy = float(np.mean([p == l for p, l in zip(predicted, labels)]))
+    accepted = conf >= CONF_THRESHOLD
+
+    print(f"[Evaluate] {name}:")
+    print(f"    top-1 accuracy:        {accuracy:.2%}")
+    print(f"    mean confidence:       {conf.mean():.4f}")
+    print(f"    conf >= {CONF_THRESHOLD}:          {accepted.mean():.2%}")
+    print(f"    conf histogram (0.1):  {np.histogram(conf, bins=10, range=(0, 1))[0].tolist()}")
+    return accuracy, conf
+
+
+def evaluate(args):
+    """
+    Compares top-1 accuracy and confidence drift of a candidate model
+    (default INT8) against a reference (default FP32 ONNX).
+    """
+    labels, images = load_labelled_images(args.images, args.limit)
+    if not images:
+        print(f"[Evaluate] No images found in {args.images}")
+        return 1
+
+    reference = BACKENDS[args.reference](args.weights)
+    candidate = BACKENDS[args.candidate](args.weights)
+    ref_probs = predict_in_batches(reference, images)
+    cand_probs = predict_in_batches(candidate, images)
+
+    print(f"[Evaluate] {len(images)} labelled images")
+    ref_accuracy, ref_conf = confidence_report(args.reference, ref_probs, labels, reference.names)
+    cand_accuracy, cand_conf = confidence_report(args.candidate, cand_probs, labels, candidate.names)
+
+    drop = ref_accuracy - cand_accuracy
+    print(f"[Evaluate] Accuracy drop: {drop:.2%} (max {args.max_accuracy_drop:.2%})")
+    print(f"[Evaluate] Mean |confidence drift|: {np.abs(ref_conf - cand_conf).mean():.4f}")
+    print(f"[Evaluate] Top-1 agreement: {np.mean(ref_probs.argmax(1) == cand_probs.argmax(1)):.2%}")
+
+    ok = drop <= args.max_accuracy_drop
+    print("[Evaluate] OK" if ok else "[Evaluate] FAILED: accuracy drop too large")
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CardClassifier tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parity_parser = subparsers.add_parser("parity", help="compare two inference backends")
+    parity_parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parity_parser.add_argument("--images", help="folder of flattened card crops")
+    parity_parser.add_argument("--limit", type=int)
+    parity_parser.add_argument("--reference", default="torch", choices=BACKENDS)
+    parity_parser.add_argument("--candidate", default="onnx", choices=BACKENDS)
+    parity_parser.add_argument("--tolerance", type=float, default=0.05)
+    parity_parser.add_argument("--min-agreement", type=float, default=0.99)
+    parity_parser.set_defaults(func=parity)
+
+    quantize_parser = subparsers.add_parser("quantize", help="build the INT8 classifier")
+    quantize_parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    quantize_parser.add_argument("--calibration", required=True, help="folder of flattened card crops")
+    quantize_parser.add_argument("--limit", type=int, default=500)
+    quantize_parser.add_argument("--eval-images", help="labelled folder; refuse the model if the gate fails")
+    quantize_parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    quantize_parser.set_defaults(func=quantize)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="accuracy and confidence drift vs a reference")
+    evaluate_parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    evaluate_parser.add_argument("--images", required=True, help="folder with one subfolder per label")
+    evaluate_parser.add_argument("--limit", type=int)
+    evaluate_parser.add_argument("--reference", default="onnx", choices=BACKENDS)
+    evaluate_parser.add_argument("--candidate", default="onnx_int8", choices=BACKENDS)
+    evaluate_parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    evaluate_parser.set_defaults(func=evaluate)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,54 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import cv2
-import numpy as np
-import base64
-from io import BytesIO
-from PIL import Image
 import asyncio
 import json
+from time import perf_counter
 
 from opencv import CardDetector
-from yolo import CardClassifier
-from card_mapper import CardMapper
+from yolo import CardClassifier, load_classifier
+from frame_buffer import LatestFrameBuffer
+from frame_executor import FrameExecutor
+from inference_batcher import InferenceBatcher, BATCHING_ENABLED
+from card_tracker import CardTracker
+from motion_gate import MotionGate
+from roi import RoiPlanner, ROI_ENABLED
+from metrics import METRICS
+from trace_context import new_trace, add_hop, now_ms
 import os
 
 # ---------- App ----------
 
 app = FastAPI(title="Computer Vision Service", version="1.0")
 
+# Classifier weights, loaded once at startup (and on /cv/reload)
+MODEL_PATH = os.environ.get("CV_MODEL_PATH", "./runs/classify/sueca_cards_classifier/weights/best.pt")
+
 # ---------- Global State ----------
 
 detector: Optional[CardDetector] = None
 classifier: Optional[CardClassifier] = None
+executor: Optional[FrameExecutor] = None
+batcher: Optional[InferenceBatcher] = None
 active_games: dict = {}
+active_streams = 0  # open /cv/stream connections (load reported in /health)
+model_path: Optional[str] = None
+models_ready = False  # readiness: models loaded and warmed up (liveness is /health)
+models_error: Optional[str] = None
+reload_lock = asyncio.Lock()
 
 
 # ---------- Models ----------
 
 class StartCVRequest(BaseModel):
     game_id: str
+    # Labels already reported for this game (a game moved from another worker)
+    sent_labels: List[str] = []
+
+
+class ReloadModelRequest(BaseModel):
+    model_path: Optional[str] = None
 
 
 class ProcessFrameRequest(BaseModel):
@@ -69,69 +89,246 @@ def parse_label(label: str):
     return rank, suit
 
 
-def base64_to_image(base64_string: str) -> Optional[np.ndarray]:
+def new_game_state() -> dict:
+    """
+    Creates the per-game tracking state.
+    """
+    return {
+        "last_labels": {},
+        "sent_labels": set(),
+        "tracker": CardTracker(),
+        "motion_gate": MotionGate(),
+        "roi_planner": RoiPlanner() if ROI_ENABLED else None,
+        "reset_epoch": 0,
+        "frames_received": 0,
+        "frames_processed": 0,
+        "frames_dropped": 0,
+        "frames_skipped": 0,
+        "cards_classified": 0,
+        "cards_cached": 0,
+        "roi_full_scans": 0,
+        "roi_window_scans": 0
+    }
+
+
+def reset_cards(game_state: dict):
+    """
+    Forgets the cards seen so far. Done in place, so a running stream keeps
+    using the same state; results of frames from before are ignored (epoch).
+    """
+    game_state["reset_epoch"] += 1
+    game_state["sent_labels"].clear()
+    game_state["last_labels"].clear()
+    game_state["tracker"].reset()
+    game_state["motion_gate"].reset()
+    if game_state["roi_planner"]:
+        game_state["roi_planner"].reset()
+
+
+def count_game(game_id: str, game_state: dict, counter: str, amount: int = 1):
     """
-    Converts a base64 string to OpenCV image (numpy array).
+    Increments a frame or card counter of the game and the service-wide metric.
     """
+    game_state[counter] += amount
+    METRICS.count(game_id, counter, amount)
+
+
+async def classify_tracks(game_id: str, game_state: dict, frame_result):
+    """
+    Matches the detected cards to the game's tracks and classifies only the
+    new, moved or stale ones. Fills frame_result.detections from the tracks.
+    """
+    start = perf_counter()
+    tracker = game_state["tracker"]
+    tracks = tracker.update(frame_result.corners)
+
+    if classifier is not None:
+        pending = [i for i, track in enumerate(tracks) if tracker.needs_classification(track)]
+        if pending:
+            # The flattened batch goes as-is when every card needs a label
+            if len(pending) == len(tracks):
+                cards = frame_result.cards
+            else:
+                cards = frame_result.cards[pending]
+            if batcher is not None:
+                # Classify together with other games' cards
+                labels = await batcher.classify(cards)
+            else:
+                METRICS.observe_batch(len(cards))
+                labels = await executor.classify(classifier, cards)
+            frame_result.timings["classify"] = perf_counter() - start
+            for i, (label, conf) in zip(pending, labels):
+                tracker.add_vote(tracks[i], label, conf)
+
+        count_game(game_id, game_state, "cards_classified", len(pending))
+        count_game(game_id, game_state, "cards_cached", len(tracks) - len(pending))
+
+    frame_result.detections = [
+        (track.track_id, track.label, track.conf, track.vote_count) for track in tracks
+    ]
+    frame_result.cards = []
+
+
+async def report_detections(websocket: WebSocket, game_state: dict, frame_result):
+    """
+    Sends new card detections of a processed frame back to the middleware.
+    """
+    last_labels = game_state["last_labels"]
+    sent_labels = game_state["sent_labels"]
+
+    for i, class_label, conf, votes in frame_result.detections:
+        label_str = f"{class_label} ({conf:.2f})" if class_label else "Unknown"
+
+        prev_label = last_labels.get(i)
+        if prev_label != label_str and class_label:
+            print(f"[CV Service] Card {i}: {label_str}")
+            last_labels[i] = label_str
+
+            # Only report new detections
+            if class_label not in sent_labels:
+                rank, suit = parse_label(class_label)
+                if rank and suit:
+                    # Send detection back to middleware
+                    detection = {
+                        "rank": rank,
+                        "suit": suit,
+                        "confidence": conf,
+                        "position": i,
+                        "votes": votes,
+                        "frame_seq": frame_result.seq,
+                        "capture_ts_ms": frame_result.capture_ts_ms
+                    }
+                    # Trace context, extended by the middleware and game service
+                    frame_id = frame_result.seq if frame_result.seq is not None else f"t{frame_result.hops[0][1]:.0f}"
+                    trace = new_trace(f"{frame_id}:{i}", frame_result.capture_ts_ms)
+                    trace["hops"] += frame_result.hops
+                    detection["trace"] = add_hop(trace, "cv_sent")
+                    start = perf_counter()
+                    await websocket.send_json({
+                        "success": True,
+                        "detection": detection
+                    })
+                    timings = frame_result.timings
+                    timings["send"] = timings.get("send", 0.0) + perf_counter() - start
+                    sent_labels.add(class_label)
+                    print(f"[CV Service] ✓ New card detected: {rank} of {suit} (confidence: {conf:.2%}, votes: {votes})")
+
+
+# ---------- Endpoints ----------
+
+def find_model_path() -> Optional[str]:
+    if os.path.exists(MODEL_PATH):
+        print(f"[CV Service] YOLO model found: {MODEL_PATH}")
+        return MODEL_PATH
+    print("[CV Service] No YOLO model found. Falling back to template matching.")
+    return None
+
+
+def load_models():
+    """
+    Loads and warms up the detector, classifier and worker pool. Runs once
+    per process; games only get their own state in active_games.
+    """
+    global detector, classifier, executor, batcher, model_path, models_ready
+    model_path = find_model_path()
+    detector = CardDetector(debug=False)
+    classifier = load_classifier(model_path)
+    if classifier is not None:
+        print(f"[CV Service] Classifier initialized successfully ({classifier.backend_name})")
+
+    # Worker pool for frame processing (shared by all games)
+    executor = FrameExecutor(model_path=model_path, min_area=detector.min_area)
+    executor.warm_up()  # Process mode: workers load their models now, not on the first frames
+
+    # Shared inference queue across games (optional)
+    if BATCHING_ENABLED and classifier is not None:
+        batcher = InferenceBatcher(classifier)
+    models_ready = True
+
+
+async def warm_up():
+    """
+    Loads the models in the background; /ready reports when they are done.
+    """
+    global models_error
+    start = perf_counter()
     try:
-        # Decode base64
-        img_data = base64.b64decode(base64_string)
-        
-        # Convert to PIL Image
-        pil_image = Image.open(BytesIO(img_data))
-        
-        # Convert to OpenCV format (BGR)
-        opencv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-        
-        return opencv_image
+        await asyncio.to_thread(load_models)
     except Exception as e:
-        print(f"[CV Service] Error converting base64 to image: {e}")
-        return None
+        models_error = str(e)
+        print(f"[CV Service] Error loading models: {e}")
+        return
+    print(f"[CV Service] Models ready in {perf_counter() - start:.1f}s")
 
 
-# ---------- Endpoints ----------
+@app.on_event("startup")
+async def startup_models():
+    """
+    Starts loading the models without holding up the server start, so
+    liveness checks answer right away.
+    """
+    app.state.warm_up = asyncio.create_task(warm_up())
+
 
 @app.post("/cv/start")
 async def start_cv_service(request: StartCVRequest):
     """
-    Initializes the CV service with detector and classifier.
+    Starts tracking a game with the already loaded models.
     """
-    global detector, classifier
-    
-    try:
-        # Initialize detector
-        detector = CardDetector(debug=False, min_area=10000)
-        
-        # Find YOLO model
-        model_path = None
-        runs_path = "./runs/classify/sueca_cards_classifier/weights/best.pt"
-        if os.path.exists(runs_path):
-            model_path = runs_path
-            print(f"[CV Service] YOLO model found: {model_path}")
-
-        # Initialize classifier if model found
-        if model_path is not None and os.path.exists(model_path):
-            classifier = CardClassifier(model_path=model_path)
-            print("[CV Service] Classifier initialized successfully")
-        else:
-            print("[CV Service] No YOLO model found. Only detection will be available.")
-            classifier = None
-        
-        # Track this game
-        active_games[request.game_id] = {
-            "last_labels": {},
-            "sent_labels": set()
-        }
-        
-        return {
-            "success": True,
-            "message": "CV service started successfully",
-            "has_classifier": classifier is not None
-        }
-        
-    except Exception as e:
-        print(f"[CV Service] Error starting service: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    if not models_ready:
+        raise HTTPException(status_code=503, detail="Models not loaded yet")
+
+    game_state = active_games.get(request.game_id)
+    if game_state is None:
+        game_state = active_games[request.game_id] = new_game_state()
+    else:
+        reset_cards(game_state)
+    game_state["sent_labels"].update(request.sent_labels)
+    return {
+        "success": True,
+        "message": "CV service started successfully",
+        "has_classifier": classifier is not None
+    }
+
+
+@app.post("/cv/reload")
+async def reload_model(request: ReloadModelRequest):
+    """
+    Loads new classifier weights beside the running ones and swaps them in
+    once warmed up. Streams keep using the old weights until the swap.
+    """
+    global classifier, executor, batcher, model_path
+    if not models_ready:
+        raise HTTPException(status_code=503, detail="Models not loaded yet")
+    path = request.model_path or MODEL_PATH
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Model not found: {path}")
+
+    async with reload_lock:
+        start = perf_counter()
+        try:
+            new_classifier = await asyncio.to_thread(load_classifier, path)
+            new_executor = None
+            if executor.mode == "process":
+                # Process workers hold their own copy of the weights: swap in a primed pool
+                new_executor = FrameExecutor(model_path=path, min_area=detector.min_area)
+                await asyncio.to_thread(new_executor.warm_up)
+        except Exception as e:
+            print(f"[CV Service] Error reloading model: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        classifier = new_classifier
+        if batcher is not None:
+            batcher.classifier = new_classifier
+        elif BATCHING_ENABLED:
+            batcher = InferenceBatcher(new_classifier)
+        if new_executor is not None:
+            old_executor, executor = executor, new_executor
+            old_executor.shutdown(cancel_futures=False)  # Frames in flight still finish
+        model_path = path
+
+    print(f"[CV Service] Model reloaded from {path} in {perf_counter() - start:.1f}s")
+    return {"success": True, "model_path": path}
 
 
 @app.websocket("/cv/stream/{game_id}")
@@ -139,101 +336,130 @@ async def cv_stream(websocket: WebSocket, game_id: str):
     """
     WebSocket endpoint to receive continuous video stream and process cards.
     """
-    global detector, classifier
-    
+    global active_streams
     await websocket.accept()
     print(f"[CV Service] WebSocket connected for game: {game_id}")
     
-    if detector is None:
-        await websocket.send_json({"error": "CV service not initialized. Call /cv/start first."})
+    if not models_ready:
+        await websocket.send_json({"error": "CV service not ready. Models are still loading."})
         await websocket.close()
         return
     
     # Get or create game state
     if game_id not in active_games:
-        active_games[game_id] = {
-            "last_labels": {},
-            "sent_labels": set()
-        }
+        active_games[game_id] = new_game_state()
     
     game_state = active_games[game_id]
-    last_labels = game_state["last_labels"]
-    sent_labels = game_state["sent_labels"]
-    
-    frame_count = 0
     
-    try:
+    # Latest-frame-wins: only the newest unprocessed frame is kept
+    frame_buffer = LatestFrameBuffer()
+
+    async def process_frames():
+        frame_count = 0
         while True:
-            # Receive message from websocket
-            message = await websocket.receive_text()
-            
-            # Check if it's a command (JSON) or frame data (base64)
-            if message.startswith("{"):
-                # It's a command
-                try:
-                    command = json.loads(message)
-                    if command.get("action") == "reset_cards":
-                        print(f"[CV Service] 🔄 Received reset command - clearing card history")
-                        sent_labels.clear()
-                        last_labels.clear()
-                        await websocket.send_json({
-                            "success": True,
-                            "message": "cards_reset"
-                        })
-                        continue
-                except json.JSONDecodeError:
-                    pass  # Not a valid JSON, treat as frame
-            
-            # It's a base64 frame
-            frame_base64 = message
+            payload, received_ms = await frame_buffer.get()
+            epoch = game_state["reset_epoch"]
+
+            # Decode + detect in the worker pool (static frames are skipped,
+            # unless some card is still being voted on)
+            motion_gate = game_state["motion_gate"]
+            reference = motion_gate.reference_for_next(force=game_state["tracker"].has_unconfirmed())
+
+            # ROI mode: search only around tracked cards, with periodic full scans
+            roi_planner = game_state["roi_planner"]
+            rois = roi_planner.plan(game_state["tracker"]) if roi_planner else None
+
+            tracker = game_state["tracker"]
+            frame_result = await executor.detect(detector, payload, reference, rois, tracker.card_area())
             frame_count += 1
-            
-            # Convert base64 to image
-            frame = base64_to_image(frame_base64)
-            if frame is None:
+
+            # Ignore results of frames captured before a reset_cards command
+            if frame_result is None or epoch != game_state["reset_epoch"]:
                 continue
-            
-            # Detect cards using OpenCV
-            flatten_cards, img_result, four_corners_set = detector.detect_cards_from_frame(frame)
-            
-            # Classify cards if classifier is available
-            if flatten_cards and classifier:
-                for i, flat_card in enumerate(flatten_cards):
-                    class_label, conf = classifier.classify(flat_card)
-                    label_str = f"{class_label} ({conf:.2f})" if class_label else "Unknown"
-                    
-                    prev_label = last_labels.get(i)
-                    if prev_label != label_str and class_label:
-                        print(f"[CV Service] Card {i}: {label_str}")
-                        last_labels[i] = label_str
-                        
-                        # Only report new detections
-                        if class_label not in sent_labels:
-                            rank, suit = parse_label(class_label)
-                            if rank and suit:
-                                # Send detection back to middleware
-                                detection = {
-                                    "rank": rank,
-                                    "suit": suit,
-                                    "confidence": conf,
-                                    "position": i
-                                }
-                                await websocket.send_json({
-                                    "success": True,
-                                    "detection": detection
-                                })
-                                sent_labels.add(class_label)
-                                print(f"[CV Service] ✓ New card detected: {rank} of {suit} (confidence: {conf:.2%})")
-            
+            frame_result.hops += [["cv_received", received_ms], ["cv_detected", now_ms()]]
+
+            if frame_result.signature is not None:
+                motion_gate.record(frame_result.signature, frame_result.skipped)
+            if frame_result.skipped:
+                count_game(game_id, game_state, "frames_skipped")
+                METRICS.observe_timings(game_id, frame_result.timings)
+                continue
+            # Counted once the frame goes through tracking (not undecodable or skipped)
+            count_game(game_id, game_state, "frames_processed")
+            if roi_planner:
+                roi_planner.record(rois, frame_result.frame_size)
+                count_game(game_id, game_state, "roi_full_scans" if rois is None else "roi_window_scans")
+
+            # Track cards across frames, classify only what changed
+            await classify_tracks(game_id, game_state, frame_result)
+            if epoch != game_state["reset_epoch"]:
+                continue
+            frame_result.hops.append(["cv_classified", now_ms()])
+
+            await report_detections(websocket, game_state, frame_result)
+            METRICS.observe_timings(game_id, frame_result.timings)
+
             # Log progress every 30 frames
             if frame_count % 30 == 0:
-                cards_sent = len(sent_labels)
+                cards_sent = len(game_state["sent_labels"])
+                print(f"[CV Service] {game_id}: {game_state['frames_processed']} frames processed, "
+                      f"{game_state['frames_dropped']} dropped, {game_state['frames_skipped']} skipped, "
+                      f"{cards_sent} cards sent")
+
+    processing_task = asyncio.create_task(process_frames())
+    active_streams += 1
+    
+    try:
+        while True:
+            # Receive message from websocket (binary frame or text)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            # Surface errors from the processing task
+            if processing_task.done():
+                processing_task.result()
+
+            if message.get("bytes") is not None:
+                # Binary frame: header (seq + timestamp) + JPEG/WebP bytes
+                payload = message["bytes"]
+            else:
+                payload = message.get("text") or ""
+
+                # Check if it's a command (JSON) or frame data (base64)
+                if payload.startswith("{"):
+                    # It's a command
+                    try:
+                        command = json.loads(payload)
+                        if command.get("action") == "reset_cards":
+                            print(f"[CV Service] 🔄 Received reset command - clearing card history")
+                            reset_cards(game_state)
+                            frame_buffer.clear()
+                            await websocket.send_json({
+                                "success": True,
+                                "message": "cards_reset"
+                            })
+                            continue
+                    except json.JSONDecodeError:
+                        pass  # Not a valid JSON, treat as frame
+
+                # It's a base64 frame (fallback)
+
+            count_game(game_id, game_state, "frames_received")
+            if frame_buffer.put((payload, now_ms())):
+                count_game(game_id, game_state, "frames_dropped")
                 
     except WebSocketDisconnect:
         print(f"[CV Service] WebSocket disconnected for game: {game_id}")
     except Exception as e:
         print(f"[CV Service] Error in WebSocket stream: {e}")
         await websocket.close()
+    finally:
+        active_streams -= 1
+        processing_task.cancel()
+        await asyncio.gather(processing_task, return_exceptions=True)
+        # The per-game series end with the stream (the totals are kept)
+        METRICS.forget_game(game_id)
 
 
 @app.post("/cv/stop")
@@ -243,18 +469,63 @@ async def stop_cv_service(game_id: str):
     """
     if game_id in active_games:
         del active_games[game_id]
+        METRICS.forget_game(game_id)
         return {"success": True, "message": "CV service stopped"}
     return {"success": False, "message": "Game not found"}
 
 
+@app.on_event("shutdown")
+def shutdown_executor():
+    """
+    Stops the frame worker pool and the inference batcher.
+    """
+    if executor is not None:
+        executor.shutdown()
+    if batcher is not None:
+        batcher.stop()
+
+
 @app.get("/health")
 async def health_check():
     """
-    Health check endpoint.
+    Liveness check endpoint (answers while the models are still loading).
     """
     return {
         "status": "healthy",
+        "ready": models_ready,
         "detector_loaded": detector is not None,
+        "buffer_pool": detector.buffer_stats() if detector else None,
         "classifier_loaded": classifier is not None,
-        "active_games": len(active_games)
+        "classifier_backend": classifier.backend_name if classifier else None,
+        "model_path": model_path,
+        "executor": executor.mode if executor else None,
+        "batching": batcher is not None,
+        "active_games": len(active_games),
+        # Load figures, used by the middleware to place tables on CV workers
+        "load": {
+            "games": len(active_games),
+            "streams": active_streams,
+            "workers": executor.max_workers if executor else 0,
+            "frames_received": METRICS.counters["frames_received"],
+            "frames_processed": METRICS.counters["frames_processed"],
+            "frames_dropped": METRICS.counters["frames_dropped"]
+        }
     }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness check endpoint: 503 until the models are loaded and warmed up.
+    """
+    if not models_ready:
+        return JSONResponse(status_code=503, content={"ready": False, "error": models_error})
+    return {"ready": True, "model_path": model_path, "has_classifier": classifier is not None}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Stage latencies, frame counters and batch sizes (Prometheus text format).
+    """
+    return METRICS.render()
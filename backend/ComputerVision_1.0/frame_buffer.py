@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Optional
+
+
+class LatestFrameBuffer:
+    """
+    Bounded ingest stage (size 1) for a single game stream.
+    Keeps only the newest frame: a frame that arrives while the previous one
+    is still waiting to be processed replaces it and counts as dropped.
+    """
+
+    def __init__(self):
+        self._frame: Optional[Any] = None
+        self._has_frame = asyncio.Event()
+
+    def put(self, frame: Any) -> bool:
+        """
+        Stores a frame, discarding the pending one (if any).
+        Returns True if a pending frame was dropped.
+        """
+        dropped = self._frame is not None
+        self._frame = frame
+        self._has_frame.set()
+        return dropped
+
+    async def get(self) -> Any:
+        """
+        Waits for and returns the newest frame.
+        """
+        await self._has_frame.wait()
+        frame = self._frame
+        self._frame = None
+        self._has_frame.clear()
+        return frame
+
+    def clear(self):
+        """
+        Discards the pending frame.
+        """
+        self._frame = None
+        self._has_frame.clear()
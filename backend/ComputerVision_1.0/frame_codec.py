@@ -0,0 +1,92 @@
+import base64
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+# ---------- Binary Frame Format ----------
+#
+# Frames binários (WebSocket binary message):
+#   magic (4 bytes, b"SVF1") | seq (uint32) | capture_ts_ms (uint64) | JPEG/WebP bytes
+# Tudo em big-endian. Um payload binário sem magic é tratado como imagem crua.
+# Frames de texto continuam a ser base64 (fallback para clientes antigos).
+
+FRAME_MAGIC = b"SVF1"
+FRAME_HEADER = struct.Struct("!4sIQ")
+
+
+@dataclass
+class Frame:
+    image: np.ndarray
+    seq: Optional[int] = None
+    capture_ts_ms: Optional[int] = None
+
+
+def encode_frame(image_bytes: bytes, seq: int, capture_ts_ms: int) -> bytes:
+    """
+    Builds a binary frame message (header + encoded image bytes).
+    """
+    return FRAME_HEADER.pack(FRAME_MAGIC, seq & 0xFFFFFFFF, capture_ts_ms) + image_bytes
+
+
+def decode_image_bytes(buffer, offset: int = 0) -> Optional[np.ndarray]:
+    """
+    Decodes JPEG/WebP bytes straight to an OpenCV BGR image (single decode, no PIL).
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=offset)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def decode_binary_frame(payload: bytes) -> Optional[Frame]:
+    """
+    Decodes a binary WebSocket frame into a Frame.
+    """
+    try:
+        if len(payload) >= FRAME_HEADER.size and payload[:4] == FRAME_MAGIC:
+            _, seq, capture_ts_ms = FRAME_HEADER.unpack_from(payload)
+            image = decode_image_bytes(payload, offset=FRAME_HEADER.size)
+        else:
+            seq, capture_ts_ms = None, None
+            image = decode_image_bytes(payload)
+
+        if image is None:
+            return None
+        return Frame(image=image, seq=seq, capture_ts_ms=capture_ts_ms)
+    except Exception as e:
+        print(f"[CV Service] Error decoding binary frame: {e}")
+        return None
+
+
+def base64_to_image(base64_string: str) -> Optional[np.ndarray]:
+    """
+    Converts a base64 string to OpenCV image (numpy array).
+    """
+    try:
+        return decode_image_bytes(base64.b64decode(base64_string))
+    except Exception as e:
+        print(f"[CV Service] Error converting base64 to image: {e}")
+        return None
+
+
+def decode_base64_frame(base64_string: str) -> Optional[Frame]:
+    """
+    Decodes a legacy base64 text frame (no header) into a Frame.
+    """
+    image = base64_to_image(base64_string)
+    if image is None:
+        return None
+    return Frame(image=image)
+
+
+def decode_frame(payload) -> Optional[Frame]:
+    """
+    Decodes a WebSocket frame payload: bytes (binary frame) or str (base64).
+    """
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return decode_binary_frame(payload)
+    return decode_base64_frame(payload)
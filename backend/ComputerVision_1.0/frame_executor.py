@@ -0,0 +1,187 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import monotonic, perf_counter, sleep
+from typing import Optional
+
+from frame_codec import decode_frame
+from metrics import lap
+from motion_gate import MOTION_GATE_ENABLED, motion_signature, is_static
+
+
+# ---------- Config ----------
+
+# "thread": OpenCV/torch release the GIL, one shared model copy
+# "process": each worker process loads its own detector + classifier
+EXECUTOR_MODE = os.environ.get("CV_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("CV_WORKERS", "4"))
+
+
+@dataclass
+class FrameResult:
+    seq: Optional[int] = None
+    capture_ts_ms: Optional[int] = None
+    corners: list = field(default_factory=list)  # four_corners_set of the detected cards
+    cards: object = None  # flattened cards batch (N, 280, 200, 3), same order as corners
+    detections: list = field(default_factory=list)  # [(track_id, label, confidence, votes)]
+    signature: object = None  # motion gate signature of the frame
+    skipped: bool = False  # static frame, detection not run
+    frame_size: tuple = None  # (w, h) of the frame
+    timings: dict = field(default_factory=dict)  # stage -> seconds spent in the worker
+    hops: list = field(default_factory=list)  # [hop, timestamp ms] inside the CV service (tracing)
+
+
+def detect_frame(detector, payload, reference=None, rois=None, card_area=None) -> Optional[FrameResult]:
+    """
+    Decodes a frame and runs card detection + flattening, unless the frame
+    is static compared with the reference signature of the motion gate.
+    With rois, only those windows of the frame are searched. card_area (the
+    tracked card size) drives the detector's processing resolution.
+    Returns None if the frame could not be decoded.
+    """
+    timings = {}
+    start = perf_counter()
+    frame_data = decode_frame(payload)
+    if frame_data is None:
+        return None
+    lap(timings, "decode", start)
+
+    # Motion gate: skip the pipeline if nothing changed on the table
+    signature = None
+    if MOTION_GATE_ENABLED:
+        signature = motion_signature(frame_data.image)
+        if is_static(signature, reference):
+            return FrameResult(
+                seq=frame_data.seq,
+                capture_ts_ms=frame_data.capture_ts_ms,
+                signature=signature,
+                skipped=True,
+                timings=timings
+            )
+
+    # Detect cards using OpenCV
+    flatten_cards, img_result, four_corners_set = detector.detect_cards_from_frame(
+        frame_data.image, rois, card_area, timings
+    )
+
+    return FrameResult(
+        seq=frame_data.seq,
+        capture_ts_ms=frame_data.capture_ts_ms,
+        corners=four_corners_set,
+        cards=flatten_cards,
+        signature=signature,
+        frame_size=(frame_data.image.shape[1], frame_data.image.shape[0]),
+        timings=timings
+    )
+
+
+def classify_cards(classifier, cards) -> list:
+    """
+    Classifies the given cards in a single batched inference.
+    """
+    if classifier is None or len(cards) == 0:
+        return []
+    return classifier.classify_batch(cards)
+
+
+# ---------- Process Pool Worker ----------
+
+_worker_detector = None
+_worker_classifier = None
+
+
+def _init_worker(model_path, min_area):
+    """
+    Loads a detector and classifier copy inside a worker process.
+    """
+    global _worker_detector, _worker_classifier
+    from opencv import CardDetector
+
+    _worker_detector = CardDetector(debug=False, min_area=min_area)
+    from yolo import load_classifier
+    _worker_classifier = load_classifier(model_path)
+    print(f"[CV Worker {os.getpid()}] Ready")
+
+
+def _detect_frame_in_worker(payload, reference, rois, card_area) -> Optional[FrameResult]:
+    return detect_frame(_worker_detector, payload, reference, rois, card_area)
+
+
+def _classify_cards_in_worker(cards) -> list:
+    return classify_cards(_worker_classifier, cards)
+
+
+def _worker_pid(delay: float) -> int:
+    # No-op used to prime the pool; the delay spreads a round over the workers
+    sleep(delay)
+    return os.getpid()
+
+
+# ---------- Executor ----------
+
+class FrameExecutor:
+    """
+    Runs frame processing off the asyncio event loop.
+    Each game awaits one frame at a time, so per-game ordering is preserved
+    while different games are processed concurrently.
+    """
+
+    def __init__(self, mode=EXECUTOR_MODE, max_workers=EXECUTOR_WORKERS, model_path=None, min_area=None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Invalid executor mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers
+
+        if mode == "process":
+            self.pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_path, min_area)
+            )
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cv-worker")
+        print(f"[CV Service] Frame executor: {mode} pool with {max_workers} workers")
+
+    def warm_up(self, timeout: float = 300.0):
+        """
+        Blocks until every worker is running with its models loaded.
+        Process workers are only spawned (and run _init_worker) on the first
+        submits, so rounds of no-op tasks are sent until all of them answered.
+        """
+        if self.mode != "process":
+            return
+        start, pids = monotonic(), set()
+        while len(pids) < self.max_workers:
+            if monotonic() - start > timeout:
+                raise TimeoutError(f"Only {len(pids)} of {self.max_workers} CV workers started")
+            futures = [self.pool.submit(_worker_pid, 0.05) for _ in range(self.max_workers)]
+            pids.update(future.result() for future in futures)
+        print(f"[CV Service] {len(pids)} worker processes ready in {monotonic() - start:.1f}s")
+
+    async def detect(self, detector, payload, reference=None, rois=None, card_area=None) -> Optional[FrameResult]:
+        """
+        Decodes and detects a frame in the pool. In process mode the
+        worker's own detector copy is used instead of the given one.
+        """
+        loop = asyncio.get_running_loop()
+        if self.mode == "process":
+            return await loop.run_in_executor(
+                self.pool, _detect_frame_in_worker, payload, reference, rois, card_area
+            )
+        return await loop.run_in_executor(self.pool, detect_frame, detector, payload, reference, rois, card_area)
+
+    async def classify(self, classifier, cards) -> list:
+        """
+        Classifies cards in the pool. In process mode the worker's own
+        classifier copy is used instead of the given one.
+        """
+        loop = asyncio.get_running_loop()
+        if self.mode == "process":
+            return await loop.run_in_executor(self.pool, _classify_cards_in_worker, cards)
+        return await loop.run_in_executor(self.pool, classify_cards, classifier, cards)
+
+    def shutdown(self, cancel_futures=True):
+        self.pool.shutdown(wait=False, cancel_futures=cancel_futures)
@@ -1,14 +1,12 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
-import requests
 from typing import Optional
 from card_mapper import CardMapper
 from referee import Referee
-import threading
-import time
+from trace_context import add_hop
+from game_sessions import GameSession, SessionRegistry
 
 app = FastAPI(title="Card Game Backend")
-ref = Referee()
 
 MIDDLEWARE_URL = "http://localhost:8000/game/state"
 MIDDLEWARE_ROUND_END_URL = "http://localhost:8000/game/round_end"
@@ -16,62 +14,109 @@ MIDDLEWARE_ROUND_END_URL = "http://localhost:8000/game/round_end"
 # Game constants
 MAX_ROUNDS = 4  # 4 rondas por jogo
 MAX_RODADAS = 10  # 10 rodadas por ronda
-current_round = 1  # Ronda atual (1-4)
-current_hand = ref.current_player -1
+
+# One Referee per table, keyed by game_id; the routes without game_id use DEFAULT_GAME_ID
+DEFAULT_GAME_ID = "default"
+sessions = SessionRegistry(MIDDLEWARE_URL)
 
 class CardDTO(BaseModel):
     rank: str
     suit: str
     confidence: Optional[float] = None
+    trace: Optional[dict] = None  # trace context of the detection (latency tracing)
+
+@app.get("/games/{game_id}/state")
+def get_game_state(game_id: str):
+    session = sessions.get(game_id)
+    with session.lock:
+        return session.ref.state()
 
 @app.get("/state")
 def get_state():
-    return ref.state()
-
-def send_state_to_middleware(ref):
-    with threading.Lock():
-        time.sleep(0.05)
-        try:
-            requests.post(MIDDLEWARE_URL, json=ref.state(), timeout=1.0)
-            print("[SYNC] State pushed to middleware")
-        except requests.exceptions.RequestException as e:
-            print(f"[WARN] State sync failed: {e}")
-
-def push_state(ref):
-    threading.Thread(
-        target=send_state_to_middleware,
-        args=(ref,),
-        daemon=True
-    ).start()
+    return get_game_state(DEFAULT_GAME_ID)
+
+def push_state(session: GameSession, trace=None):
+    # Snapshot now, so the sender keeps the order of the state changes
+    state = session.ref.state()
+    if trace is not None:
+        # The state push gets its own copy of the card's trace
+        state["trace"] = {**trace, "hops": list(trace["hops"])}
+    session.state_sender.push(state)
+
+@app.on_event("shutdown")
+def stop_sessions():
+    sessions.close()
+
+
+def traced(response: dict, trace: Optional[dict]) -> dict:
+    """
+    Adds the trace context (with the response hop) to a /card response.
+    """
+    if trace is not None:
+        response["trace"] = add_hop(trace, "game_responded")
+    return response
+
+@app.post("/games/{game_id}/reset")
+def reset_game_session(game_id: str):
+    session = sessions.get(game_id)
+    with session.lock:
+        session.ref = Referee()
+        session.current_round = 1
+    return {"success": True, "message": "Game reset"}
 
 @app.post("/reset")
 def reset_game():
-    global ref, current_round
-    ref = Referee()
-    current_round = 1
-    return {"success": True, "message": "Game reset"}
+    return reset_game_session(DEFAULT_GAME_ID)
+
+@app.post("/games/{game_id}/new_round")
+def new_game_round(game_id: str):
+    """Inicia uma nova ronda (reset do referee mas mantém victories)"""
+    session = sessions.get(game_id)
+    with session.lock:
+        team1_vict = session.ref.team1_victories
+        team2_vict = session.ref.team2_victories
+        session.ref = Referee()
+        session.ref.team1_victories = team1_vict
+        session.ref.team2_victories = team2_vict
+        session.current_round += 1
+        return {
+            "success": True, 
+            "message": f"Nova ronda {session.current_round} iniciada",
+            "round": session.current_round
+        }
 
 @app.post("/new_round")
 def new_round():
-    """Inicia uma nova ronda (reset do referee mas mantém victories)"""
-    global ref, current_round
-    team1_vict = ref.team1_victories
-    team2_vict = ref.team2_victories
-    ref = Referee()
-    ref.team1_victories = team1_vict
-    ref.team2_victories = team2_vict
-    current_round += 1
-    return {
-        "success": True, 
-        "message": f"Nova ronda {current_round} iniciada",
-        "round": current_round
-    }
+    return new_game_round(DEFAULT_GAME_ID)
+
+@app.delete("/games/{game_id}")
+def end_game(game_id: str):
+    """Termina a sessão do jogo (liberta o referee)"""
+    if sessions.remove(game_id):
+        return {"success": True, "message": "Game ended"}
+    return {"success": False, "message": "Game not found"}
+
+@app.get("/games")
+def list_games():
+    # state_sync: revision and sent / coalesced / full_syncs / failed pushes to the middleware
+    return {"active_games": len(sessions), "state_sync": sessions.sync_stats()}
+
+@app.post("/games/{game_id}/card")
+def receive_game_card(game_id: str, card: CardDTO):
+    session = sessions.get(game_id)
+    # Cards of the same table are refereed one at a time
+    with session.lock:
+        return play_card(session, card)
 
 @app.post("/card")
 def receive_card(card: CardDTO):
-    global current_hand
+    return receive_game_card(DEFAULT_GAME_ID, card)
+
+def play_card(session: GameSession, card: CardDTO):
+    ref = session.ref
+    add_hop(card.trace, "game_received")
     if len(ref.card_queue) == 0:
-        current_hand = ref.current_player-1
+        session.current_hand = ref.current_player-1
     print(f"[DEBUG] Received card: {card.rank} {card.suit}")
     try:
         rank_index = CardMapper.RANKS.index(card.rank)
@@ -79,7 +124,7 @@ def receive_card(card: CardDTO):
         card_id = suit_index * CardMapper.SUITSIZE + rank_index
     except ValueError:
         print("[DEBUG] Invalid card!")
-        return {"success": False, "message": "Invalid card"}
+        return traced({"success": False, "message": "Invalid card"}, card.trace)
 
     ref.inject_card(card_id)
     print(f"[DEBUG] Card injected. Queue size: {len(ref.card_queue)}")
@@ -88,14 +133,14 @@ def receive_card(card: CardDTO):
         print("[DEBUG] Setting trump...")
         ref.set_trump()
         print(f"[DEBUG] Trump now: {CardMapper.get_card(ref.trump)} (suit: {ref.trump_suit})")
-        push_state(ref)
-        current_hand -= 1
-        return {
+        push_state(session, add_hop(card.trace, "referee_done"))
+        session.current_hand -= 1
+        return traced({
             "success": True,
             "message": "Trump card set"
-        }
+        }, card.trace)
 
-    current_hand += 1
+    session.current_hand += 1
 
     if len(ref.card_queue) >= 4:
         print("[DEBUG] Enough cards for a round, playing round...")
@@ -129,26 +174,24 @@ def receive_card(card: CardDTO):
             print(f"[RONDA] Acabou após 10 rodadas! Equipa {winner_team} ganhou com {winner_points} pontos")
 
         if round_ended:
-            # Notificar middleware sobre fim de ronda
-            try:
-                round_data = {
-                    "round_number": current_round,
-                    "winner_team": winner_team,
-                    "winner_points": winner_points,
-                    "team1_points": ref.team1_points,
-                    "team2_points": ref.team2_points,
-                    "game_ended": current_round >= MAX_ROUNDS
-                }
-                requests.post(MIDDLEWARE_ROUND_END_URL, json=round_data, timeout=1)
-                print(f"[SYNC] Round end notification sent to middleware")
-            except Exception as e:
-                print(f"[WARN] Failed to notify middleware: {e}")
+            # Notificar middleware sobre fim de ronda (pelo sender do jogo, fora do lock)
+            round_data = {
+                "game_id": session.game_id,
+                "round_number": session.current_round,
+                "winner_team": winner_team,
+                "winner_points": winner_points,
+                "team1_points": ref.team1_points,
+                "team2_points": ref.team2_points,
+                "game_ended": session.current_round >= MAX_ROUNDS
+            }
+            session.state_sender.push_event(MIDDLEWARE_ROUND_END_URL, round_data)
+            print(f"[SYNC] Round end notification queued for middleware")
         
-        push_state(ref)
+        push_state(session, add_hop(card.trace, "referee_done"))
 
-    return {
+    return traced({
         "success": True,
         "message": "Card queued",
-        "current_player": current_hand%4,
+        "current_player": session.current_hand%4,
         "queue_size": len(ref.card_queue)
-    }
\ No newline at end of file
+    }, card.trace)
\ No newline at end of file
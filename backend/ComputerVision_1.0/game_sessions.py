@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+from referee import Referee
+from state_sync import StateSender
+
+# Sessions without requests for this long are evicted
+SESSION_IDLE_TIMEOUT_S = float(os.environ.get("GAME_SESSION_IDLE_TIMEOUT_S", "3600"))
+# How often get() looks for idle sessions
+SESSION_SWEEP_INTERVAL_S = 60.0
+
+
+class GameSession:
+    """
+    One table: its Referee, round/hand counters and state sender.
+    Requests of the same game are serialized with lock; different games
+    run concurrently.
+    """
+
+    def __init__(self, game_id: str, state_url: str):
+        self.game_id = game_id
+        self.ref = Referee()
+        self.current_round = 1  # Ronda atual (1-4)
+        self.current_hand = self.ref.current_player - 1
+        self.lock = threading.Lock()
+        self.state_sender = StateSender(state_url, game_id=game_id)
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def close(self):
+        self.state_sender.close()
+
+
+class SessionRegistry:
+    """
+    Game sessions keyed by game_id, created on first use and evicted after
+    idle_timeout seconds without requests.
+    """
+
+    def __init__(self, state_url: str, idle_timeout: float = SESSION_IDLE_TIMEOUT_S):
+        self.state_url = state_url
+        self.idle_timeout = idle_timeout
+        self._sessions: dict[str, GameSession] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def get(self, game_id: str) -> GameSession:
+        """
+        Session of the game (created if needed), marked as active.
+        """
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(game_id)
+            if session is None:
+                session = GameSession(game_id, self.state_url)
+                self._sessions[game_id] = session
+                print(f"[SESSIONS] Game {game_id} created ({len(self._sessions)} active)")
+            session.touch()
+            return session
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        if now - self._last_sweep < SESSION_SWEEP_INTERVAL_S:
+            return
+        self._last_sweep = now
+        for game_id, session in list(self._sessions.items()):
+            if now - session.last_active > self.idle_timeout:
+                del self._sessions[game_id]
+                session.close()
+                print(f"[SESSIONS] Game {game_id} evicted after being idle")
+
+    def remove(self, game_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(game_id, None)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def sync_stats(self) -> dict:
+        """
+        State sender counters of each session, keyed by game_id.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {session.game_id: session.state_sender.stats() for session in sessions}
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
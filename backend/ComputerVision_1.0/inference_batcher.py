@@ -0,0 +1,96 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from metrics import METRICS
+
+
+# ---------- Config ----------
+
+# Cross-game micro-batching of card classification (CV_BATCHING=1 to enable)
+BATCHING_ENABLED = os.environ.get("CV_BATCHING", "0") == "1"
+MAX_BATCH_SIZE = int(os.environ.get("CV_MAX_BATCH", "32"))
+MAX_WAIT_MS = float(os.environ.get("CV_MAX_WAIT_MS", "10"))
+
+
+@dataclass
+class _BatchRequest:
+    images: list
+    future: asyncio.Future
+
+
+class InferenceBatcher:
+    """
+    Shared inference queue for the flattened cards of all active games.
+    Requests are merged into one classify_batch call, flushed when the batch
+    reaches max_batch_size or when the oldest request waited max_wait_ms.
+    Each game gets back the labels of its own cards, in order.
+    """
+
+    def __init__(self, classifier, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue = None
+        self._task: asyncio.Task = None
+        # Uma inferência de cada vez, fora do event loop
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cv-batcher")
+
+    async def classify(self, images) -> list:
+        """
+        Queues the cards of one frame and waits for their (label, conf) results.
+        """
+        if len(images) == 0:
+            return []
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_BatchRequest(images=list(images), future=future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            size = len(pending[0].images)
+            deadline = loop.time() + self.max_wait
+
+            # Gather more requests until the batch is full or the deadline passes
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(request)
+                size += len(request.images)
+
+            images = [image for request in pending for image in request.images]
+            try:
+                labels = await loop.run_in_executor(self._pool, self.classifier.classify_batch, images)
+            except Exception as e:
+                print(f"[CV Service] Batched inference failed: {e}")
+                for request in pending:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            METRICS.observe_batch(len(images))
+
+            # Route each slice of results back to its game
+            offset = 0
+            for request in pending:
+                count = len(request.images)
+                if not request.future.done():
+                    request.future.set_result(labels[offset:offset + count])
+                offset += count
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,148 @@
+from bisect import bisect_left
+from time import perf_counter
+
+
+# Pipeline stages timed per frame
+STAGES = ("decode", "threshold", "contours", "warp", "classify", "send")
+
+# Latency buckets in seconds (1 ms .. 2.5 s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+FRAME_COUNTERS = ("frames_received", "frames_processed", "frames_dropped", "frames_skipped")
+# Cards of processed frames sent to the classifier / labelled from their track
+CARD_COUNTERS = ("cards_classified", "cards_cached")
+# Processed frames searched in full / only in the ROI windows (CV_ROI=1)
+SCAN_COUNTERS = ("roi_full_scans", "roi_window_scans")
+COUNTERS = FRAME_COUNTERS + CARD_COUNTERS + SCAN_COUNTERS
+
+
+def lap(timings, stage: str, start: float) -> float:
+    """
+    Adds the time since start to timings[stage] (if timings is given) and
+    returns the current perf_counter, to be used as the next start.
+    """
+    now = perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (now - start)
+    return now
+
+
+def escape_label(value) -> str:
+    """
+    Escapes a label value for the Prometheus text format (\\, \" and \n).
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Observing is a bisect plus two additions, cheap
+    enough to leave on for every frame.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        """
+        Prometheus text lines (cumulative buckets, sum and count).
+        """
+        sep = "," if labels else ""
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class CVMetrics:
+    """
+    Stage latencies, frame and card counters and inference batch sizes of the CV
+    service, overall and per game, rendered in the Prometheus text format.
+    Only updated from the event loop thread (worker timings travel back in
+    the FrameResult), so no locking is needed.
+    """
+
+    def __init__(self):
+        self.stages = {stage: Histogram(LATENCY_BUCKETS) for stage in STAGES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.games = {}  # game_id -> {"stages": {...}, "counters": {...}}
+
+    def _game(self, game_id: str) -> dict:
+        game = self.games.get(game_id)
+        if game is None:
+            game = {
+                "stages": {stage: Histogram(LATENCY_BUCKETS) for stage in STAGES},
+                "counters": dict.fromkeys(COUNTERS, 0)
+            }
+            self.games[game_id] = game
+        return game
+
+    def observe_stage(self, game_id: str, stage: str, seconds: float):
+        self.stages[stage].observe(seconds)
+        self._game(game_id)["stages"][stage].observe(seconds)
+
+    def observe_timings(self, game_id: str, timings: dict):
+        for stage, seconds in timings.items():
+            self.observe_stage(game_id, stage, seconds)
+
+    def count(self, game_id: str, counter: str, amount: int = 1):
+        self.counters[counter] += amount
+        self._game(game_id)["counters"][counter] += amount
+
+    def observe_batch(self, size: int):
+        self.batch_sizes.observe(size)
+
+    def forget_game(self, game_id: str):
+        """
+        Drops the per-game series of a stopped game (the totals are kept).
+        """
+        self.games.pop(game_id, None)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP cv_stage_seconds Latency of each pipeline stage, all games.",
+            "# TYPE cv_stage_seconds histogram",
+        ]
+        for stage, histogram in self.stages.items():
+            lines += histogram.render("cv_stage_seconds", f'stage="{stage}"')
+
+        lines += [
+            "# HELP cv_game_stage_seconds Latency of each pipeline stage, per game.",
+            "# TYPE cv_game_stage_seconds histogram",
+        ]
+        for game_id, game in self.games.items():
+            game_label = escape_label(game_id)
+            for stage, histogram in game["stages"].items():
+                lines += histogram.render("cv_game_stage_seconds", f'game="{game_label}",stage="{stage}"')
+
+        for counter in COUNTERS:
+            name = f"cv_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {self.counters[counter]}")
+            for game_id, game in self.games.items():
+                lines.append(f'{name}{{game="{escape_label(game_id)}"}} {game["counters"][counter]}')
+
+        lines += [
+            "# HELP cv_inference_batch_size Number of cards per classifier call.",
+            "# TYPE cv_inference_batch_size histogram",
+        ]
+        lines += self.batch_sizes.render("cv_inference_batch_size", "")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by cv_service and the inference batcher
+METRICS = CVMetrics()
@@ -0,0 +1,71 @@
+import os
+
+import cv2
+import numpy as np
+
+
+# ---------- Config ----------
+
+MOTION_GATE_ENABLED = os.environ.get("CV_MOTION_GATE", "1") == "1"
+# Fraction of signature pixels that must change for a frame to be processed
+MOTION_THRESHOLD = float(os.environ.get("CV_MOTION_THRESHOLD", "0.005"))
+# Force a full processing pass after this many skipped frames
+MOTION_REFRESH_FRAMES = int(os.environ.get("CV_MOTION_REFRESH", "15"))
+
+SIGNATURE_SIZE = (64, 36)
+PIXEL_DIFF_THRESHOLD = 25
+
+
+def motion_signature(image: np.ndarray) -> np.ndarray:
+    """
+    Heavily downscaled grayscale version of a frame, cheap to compare.
+    """
+    small = cv2.resize(image, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def changed_fraction(signature: np.ndarray, reference: np.ndarray) -> float:
+    """
+    Fraction of signature pixels that changed noticeably.
+    """
+    diff = cv2.absdiff(signature, reference)
+    _, changed = cv2.threshold(diff, PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+    return cv2.countNonZero(changed) / changed.size
+
+
+def is_static(signature: np.ndarray, reference) -> bool:
+    if reference is None or reference.shape != signature.shape:
+        return False
+    return changed_fraction(signature, reference) < MOTION_THRESHOLD
+
+
+class MotionGate:
+    """
+    Per-game frame-difference gate. Frames are compared with the last
+    processed frame; static ones skip the detection pipeline, but a frame is
+    always processed after refresh_frames consecutive skips.
+    """
+
+    def __init__(self, refresh_frames=MOTION_REFRESH_FRAMES):
+        self.refresh_frames = refresh_frames
+        self.reference = None
+        self.since_processed = 0
+
+    def reference_for_next(self, force=False):
+        """
+        Reference signature for the next frame, or None to force processing.
+        """
+        if force or self.since_processed >= self.refresh_frames:
+            return None
+        return self.reference
+
+    def record(self, signature, skipped: bool):
+        if skipped:
+            self.since_processed += 1
+        else:
+            self.reference = signature
+            self.since_processed = 0
+
+    def reset(self):
+        self.reference = None
+        self.since_processed = 0
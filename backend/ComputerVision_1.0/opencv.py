@@ -1,6 +1,12 @@
+import threading
+from time import perf_counter
+
 import cv2
 import numpy as np
 
+from buffer_pool import BufferPool
+from metrics import lap
+
 class CardDetector:
     """
     Detector Final v5: Garante geometria perfeita (Zero Skew/Distorção).
@@ -8,23 +14,72 @@ class CardDetector:
     roda apenas no final.
     """
     
-    def __init__(self, debug=True, min_area=5000, max_cards=10):
+    def __init__(self, debug=True, min_area=None, max_cards=10, target_card_area=24000,
+                 expected_card_fraction=0.02, min_scale=0.1):
         self.debug = debug
-        self.min_area = min_area
         self.max_cards = max_cards
+        # Resolução de processamento adaptativa: a área de uma carta na imagem
+        # processada fica perto de target_card_area, seja o stream 720p ou 4K
+        self.target_card_area = target_card_area
+        self.expected_card_fraction = expected_card_fraction  # estimativa sem histórico
+        self.min_scale = min_scale
+        # Área mínima de um contorno, em píxeis da imagem processada
+        self.min_area = min_area if min_area is not None else int(target_card_area * 0.3)
         # Dimensões finais para o YOLO (Sempre Portrait/Em pé)
         self.card_width = 200
         self.card_height = 280
+        self.kernel = np.ones((3, 3), np.uint8)
+        # Um BufferPool por thread de trabalho (o detector é partilhado pelo pool de threads)
+        self._local = threading.local()
+        self._pools = []
+        self._pools_lock = threading.Lock()
+
+    def buffer_pool(self):
+        """
+        BufferPool da thread atual (criado na primeira utilização).
+        """
+        pool = getattr(self._local, "pool", None)
+        if pool is None:
+            pool = BufferPool()
+            self._local.pool = pool
+            with self._pools_lock:
+                self._pools.append(pool)
+        return pool
+
+    def buffer_stats(self):
+        """
+        Alocações e reutilizações de buffers somadas em todas as threads.
+        """
+        with self._pools_lock:
+            pools = list(self._pools)
+        return {
+            "pools": len(pools),
+            "allocations": sum(pool.allocations for pool in pools),
+            "reuses": sum(pool.reuses for pool in pools),
+            "bytes": sum(pool.nbytes for pool in pools)
+        }
+
+    def get_thresh(self, img, pool=None, window=None):
+        """
+        Threshold binário da imagem, ou só da janela (x1, y1, x2, y2) dada.
+        Os resultados intermédios são escritos em buffers reutilizados (dst=).
+        """
+        pool = pool if pool is not None else BufferPool()
+        h, w = img.shape[:2]
+        x1, y1, x2, y2 = window if window is not None else (0, 0, w, h)
+
+        gray = pool.get("gray", (h, w))[y1:y2, x1:x2]
+        blur = pool.get("blur", (h, w))[y1:y2, x1:x2]
+        thresh = pool.get("thresh", (h, w))[y1:y2, x1:x2]
 
-    def get_thresh(self, img):
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (5, 5), 0)
+        gray = cv2.cvtColor(img[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY, dst=gray)
+        blur = cv2.GaussianBlur(gray, (5, 5), 0, dst=blur)
         thresh = cv2.adaptiveThreshold(blur, 255, 
                                      cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                     cv2.THRESH_BINARY_INV, 11, 2)
-        kernel = np.ones((3, 3), np.uint8)
-        thresh = cv2.erode(thresh, kernel, iterations=1)
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+                                     cv2.THRESH_BINARY_INV, 11, 2, dst=thresh)
+        # O buffer "gray" já não é preciso: serve de destino ao erode
+        eroded = cv2.erode(thresh, self.kernel, dst=gray, iterations=1)
+        thresh = cv2.morphologyEx(eroded, cv2.MORPH_CLOSE, self.kernel, dst=thresh, iterations=2)
         return thresh
 
     def reorder_points_circular(self, pts):
@@ -76,73 +131,145 @@ class CardDetector:
 
         return four_corners_set
 
+    @staticmethod
+    def merge_rois(rois, width, height):
+        """
+        Recorta as janelas à imagem e junta as que se sobrepõem,
+        para que cada zona seja processada uma única vez.
+        """
+        boxes = []
+        for x1, y1, x2, y2 in rois:
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(width, int(np.ceil(x2))), min(height, int(np.ceil(y2)))
+            if x2 > x1 and y2 > y1:
+                boxes.append([x1, y1, x2, y2])
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return boxes
+
+    def find_corners_in_rois(self, img, rois, original=None, draw=False, pool=None, timings=None):
+        """
+        Procura cartas apenas dentro das janelas (x1, y1, x2, y2) dadas:
+        threshold e contornos só correm nessas zonas da imagem.
+        """
+        h, w = img.shape[:2]
+        four_corners_set = []
+        start = perf_counter()
+        for x1, y1, x2, y2 in self.merge_rois(rois, w, h):
+            thresh = self.get_thresh(img, pool, window=(x1, y1, x2, y2))
+            start = lap(timings, "threshold", start)
+            window_corners = self.find_corners_set(thresh, None, draw=False)
+            start = lap(timings, "contours", start)
+            for corners in window_corners:
+                corners = corners + np.float32([x1, y1])
+                four_corners_set.append(corners)
+                if draw:
+                    cv2.polylines(original, [corners.astype(np.int32)], True, (0, 255, 0), 2)
+        return four_corners_set
+
     def find_flatten_cards(self, img, set_of_corners):
-        img_outputs = []
-        
-        for corners in set_of_corners:
-            pts = corners.reshape(4, 2)
+        """
+        Recorta todas as cartas para um único batch (N, 280, 200, 3).
+        A rotação e o tamanho final estão incluídos na homografia, por isso
+        cada carta é amostrada uma única vez, diretamente para o buffer.
+        """
+        batch = np.empty((len(set_of_corners), self.card_height, self.card_width, 3), dtype=img.dtype)
+
+        w, h = self.card_width - 1, self.card_height - 1
+        # Destino Portrait (200x280), sempre começa no 0,0
+        portrait_pts = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype="float32")
+        # Carta deitada: equivale a recortar para Landscape (280x200) e rodar
+        # 90 graus no sentido horário para ficar em pé para o YOLO
+        landscape_pts = np.array([[w, 0], [w, h], [0, h], [0, 0]], dtype="float32")
+
+        for i, corners in enumerate(set_of_corners):
+            pts = corners.reshape(4, 2).astype("float32")
             
-            # 1. Medir as dimensões VISUAIS deste contorno específico
+            # Medir as dimensões VISUAIS deste contorno específico
             # Largura (Topo): Distância entre ponto 0 e 1
             width = np.linalg.norm(pts[0] - pts[1])
             # Altura (Lado): Distância entre ponto 1 e 2
             height = np.linalg.norm(pts[1] - pts[2])
 
-            # 2. Decisão Geométrica:
-            # Se a largura visual for maior, o destino TEM de ser Landscape (largo).
-            # Se a altura visual for maior, o destino TEM de ser Portrait (alto).
-            
-            if width > height:
-                # Configurar destino como Landscape (280x200)
-                # Isto "casa" perfeitamente com a carta deitada, sem distorção.
-                dst_w = self.card_height  # 280
-                dst_h = self.card_width   # 200
-                needs_rotation = True     # Marcamos para rodar no fim
-            else:
-                # Configurar destino como Portrait (200x280)
-                dst_w = self.card_width   # 200
-                dst_h = self.card_height  # 280
-                needs_rotation = False
-
-            # Pontos de destino perfeitos (sempre começa no 0,0)
-            pts2 = np.array([
-                [0, 0],
-                [dst_w - 1, 0],
-                [dst_w - 1, dst_h - 1],
-                [0, dst_h - 1]
-            ], dtype="float32")
-
-            # 3. Transformação de Perspetiva (Warp)
+            # Se a largura visual for maior, a carta está deitada
+            pts2 = landscape_pts if width > height else portrait_pts
+
+            # Transformação de Perspetiva (Warp) direta para o batch
             matrix = cv2.getPerspectiveTransform(pts, pts2)
-            img_output = cv2.warpPerspective(img, matrix, (dst_w, dst_h))
+            cv2.warpPerspective(img, matrix, (self.card_width, self.card_height), dst=batch[i])
 
-            # 4. Rotação Final
-            # Se a carta estava deitada, agora que está recortada e limpa,
-            # rodamo-la 90 graus para ficar em pé para o YOLO.
-            if needs_rotation:
-                img_output = cv2.rotate(img_output, cv2.ROTATE_90_CLOCKWISE)
+        return batch
 
-            # 5. Garantia Final de Tamanho
-            # Assegura que sai sempre 200x280, aconteça o que acontecer.
-            img_output = cv2.resize(img_output, (self.card_width, self.card_height))
-            
-            img_outputs.append(img_output)
+    def choose_scale(self, frame_shape, card_area=None):
+        """
+        Escolhe a escala de processamento para que uma carta ocupe cerca de
+        target_card_area píxeis. card_area = área das cartas no frame original
+        (vinda do tracker); sem ela usa expected_card_fraction da imagem.
+        """
+        h, w = frame_shape[:2]
+        if not card_area:
+            card_area = w * h * self.expected_card_fraction
+        scale = np.sqrt(self.target_card_area / card_area)
+        # Escala em passos de 0.05: o tamanho da imagem processada (e os
+        # buffers reutilizados) não muda a cada pequena variação da carta
+        scale = round(scale * 20) / 20
+        return float(np.clip(scale, self.min_scale, 1.0))
 
-        return img_outputs
+    def detect_cards_from_frame(self, frame, rois=None, card_area=None, timings=None):
+        """
+        Deteta as cartas num frame. Os cantos devolvidos (e as rois dadas)
+        estão nas coordenadas do frame original.
+        Com timings (dict), soma o tempo das etapas threshold, contours e warp.
+        """
+        pool = self.buffer_pool()
+        start = perf_counter()
 
-    def detect_cards_from_frame(self, frame):
-        # Resize inicial para performance
-        scale = 0.75
+        # Resize adaptativo para performance
         h, w = frame.shape[:2]
-        small_frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+        scale = self.choose_scale(frame.shape, card_area)
+        small_w, small_h = max(1, int(w * scale)), max(1, int(h * scale))
+        small_frame = pool.get("small", (small_h, small_w) + frame.shape[2:], frame.dtype)
+        small_frame = cv2.resize(frame, (small_w, small_h), dst=small_frame, interpolation=cv2.INTER_AREA)
+        factor = np.float32([small_w / w, small_h / h])
         
-        debug_img = small_frame.copy() if self.debug else None
+        debug_img = None
+        if self.debug:
+            debug_img = pool.get("debug", small_frame.shape, small_frame.dtype)
+            np.copyto(debug_img, small_frame)
+
+        if rois is None:
+            thresh = self.get_thresh(small_frame, pool)
+            start = lap(timings, "threshold", start)
+            four_corners_set = self.find_corners_set(thresh, debug_img, draw=self.debug)
+            start = lap(timings, "contours", start)
+        else:
+            lap(timings, "threshold", start)
+            # Modo ROI: só perto das cartas conhecidas / área de jogo
+            small_rois = [(x1 * factor[0], y1 * factor[1], x2 * factor[0], y2 * factor[1])
+                          for x1, y1, x2, y2 in rois]
+            four_corners_set = self.find_corners_in_rois(
+                small_frame, small_rois, debug_img, draw=self.debug, pool=pool, timings=timings
+            )
+            start = perf_counter()
 
-        thresh = self.get_thresh(small_frame)
-        four_corners_set = self.find_corners_set(thresh, debug_img, draw=self.debug)
+        # Cantos de volta à resolução original
+        four_corners_set = [corners / factor for corners in four_corners_set]
         
-        # Passar o frame colorido para recorte
-        flatten_cards = self.find_flatten_cards(small_frame, four_corners_set)
+        # Recorte a partir do frame original (resolução total)
+        flatten_cards = self.find_flatten_cards(frame, four_corners_set)
+        lap(timings, "warp", start)
 
         if self.debug:
             debug_img = cv2.resize(debug_img, (w, h))
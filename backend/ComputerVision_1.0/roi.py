@@ -0,0 +1,78 @@
+import os
+from typing import Optional
+
+
+# ---------- Config ----------
+
+ROI_ENABLED = os.environ.get("CV_ROI", "0") == "1"
+# Full-frame scan every N processed frames
+ROI_FULL_SCAN_EVERY = int(os.environ.get("CV_ROI_FULL_SCAN_EVERY", "10"))
+# Search window around a tracked card, as a fraction of the card box size
+ROI_EXPAND = float(os.environ.get("CV_ROI_EXPAND", "0.5"))
+
+
+def parse_play_area(value: Optional[str]):
+    """
+    Parses "x1,y1,x2,y2" (fractions of the frame) into a tuple.
+    """
+    if not value:
+        return None
+    x1, y1, x2, y2 = (float(v) for v in value.split(","))
+    return x1, y1, x2, y2
+
+
+# Designated play area, always searched in ROI mode (e.g. "0.25,0.25,0.75,0.75")
+PLAY_AREA = parse_play_area(os.environ.get("CV_PLAY_AREA"))
+
+
+def expand_box(box, factor):
+    x1, y1, x2, y2 = box
+    dx, dy = (x2 - x1) * factor, (y2 - y1) * factor
+    return x1 - dx, y1 - dy, x2 + dx, y2 + dy
+
+
+class RoiPlanner:
+    """
+    Decides, per game, whether the next frame is searched in full or only in
+    windows around the tracked cards (plus the play area). A full scan is
+    done every full_scan_every frames, when a track was lost, or when there
+    is nothing to search around.
+    """
+
+    def __init__(self, full_scan_every=ROI_FULL_SCAN_EVERY, expand=ROI_EXPAND, play_area=PLAY_AREA):
+        self.full_scan_every = full_scan_every
+        self.expand = expand
+        self.play_area = play_area
+        self.frame_size = None  # (w, h) of the frame
+        self.frames_since_full = 0
+
+    def plan(self, tracker) -> Optional[list]:
+        """
+        Returns the search windows for the next frame, or None for a full scan.
+        """
+        track_lost = any(track.missed > 0 for track in tracker.tracks)
+        nothing_to_search = not tracker.tracks and self.play_area is None
+        if (self.frame_size is None or track_lost or nothing_to_search
+                or self.frames_since_full >= self.full_scan_every):
+            return None
+
+        rois = [expand_box(track.box, self.expand) for track in tracker.tracks]
+        if self.play_area is not None:
+            w, h = self.frame_size
+            x1, y1, x2, y2 = self.play_area
+            rois.append((x1 * w, y1 * h, x2 * w, y2 * h))
+        return rois
+
+    def record(self, rois, frame_size):
+        """
+        Updates the counters after a frame was processed with the given plan.
+        """
+        self.frame_size = frame_size
+        if rois is None:
+            self.frames_since_full = 0
+        else:
+            self.frames_since_full += 1
+
+    def reset(self):
+        # The next frame is searched in full
+        self.frames_since_full = self.full_scan_every
@@ -1,6 +1,5 @@
 
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
 
 from src.ColorHelper import ColorHelper
@@ -189,6 +188,10 @@ def template_matching(rank, suit, train_ranks, train_suits, show_plt=False) -> t
     the query card rank and suit images with the train rank and suit images.
     The best match is the rank or suit image that has the least difference."""
 
+    if show_plt:
+        # matplotlib is only needed for the debug plots, so it is imported on first use
+        import matplotlib.pyplot as plt
+
     best_rank_match_diff = 10000
     best_suit_match_diff = 10000
     best_rank_match_name = "Unknown"
@@ -209,8 +212,6 @@ def template_matching(rank, suit, train_ranks, train_suits, show_plt=False) -> t
                 plt.subplot(1, 2, 1)
                 plt.imshow(diff_img, 'gray')
 
-        plt.show()
-
     # Same processing with suit images
     for train_suit in train_suits:
 
@@ -226,15 +227,15 @@ def template_matching(rank, suit, train_ranks, train_suits, show_plt=False) -> t
                 plt.subplot(1, 2, 2)
                 plt.imshow(diff_img, 'gray')
 
-        plt.show()
-
     if best_rank_match_diff < 2300:
         best_rank_match_name = best_rank_name
 
     if best_suit_match_diff < 1000:
         best_suit_match_name = best_suit_name
 
-    plt.show()
+    # One figure with the best rank and suit differences
+    if show_plt:
+        plt.show()
 
     return best_rank_match_name, best_suit_match_name
 
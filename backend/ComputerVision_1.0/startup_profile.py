@@ -0,0 +1,104 @@
+"""
+Perfil do arranque dos serviços (tempo de import e de carregamento dos modelos).
+
+    python startup_profile.py imports cv_service
+    python startup_profile.py imports main --path ../../middleware
+    python startup_profile.py models
+
+O relatório de imports usa o `python -X importtime` num processo novo, por
+isso mede um arranque a frio do módulo.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+# Módulos pesados que devem ser carregados só quando são precisos (lazy)
+HEAVY_MODULES = ("torch", "ultralytics", "onnxruntime", "matplotlib", "PIL", "scipy")
+
+
+def parse_importtime(stderr):
+    """
+    Parses the `-X importtime` output. Returns [(name, self_us, cumulative_us, depth)].
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def profile_imports(args):
+    path = os.path.abspath(args.path)
+    start = perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+        cwd=path, capture_output=True, text=True
+    )
+    wall = perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return 1
+
+    entries = parse_importtime(result.stderr)
+    index = next((i for i, e in enumerate(entries) if e[0] == args.module and e[3] == 0), None)
+    if index is None:
+        print(f"{args.module} not found in the importtime output")
+        return 1
+    print(f"import {args.module}: {entries[index][2] / 1e6:.3f}s ({wall:.3f}s with interpreter start)")
+
+    # importtime lists children before their parent: the module's subtree is
+    # everything since the previous top-level entry
+    first = index
+    while first > 0 and entries[first - 1][3] > 0:
+        first -= 1
+    entries = entries[first:index + 1]
+    direct = [e for e in entries if e[3] == 1]
+    print(f"\nTop {args.top} imports of {args.module} (cumulative):")
+    for name, _, cumulative_us, _ in sorted(direct, key=lambda e: -e[2])[:args.top]:
+        print(f"  {cumulative_us / 1e3:9.1f} ms  {name}")
+
+    print(f"\nTop {args.top} modules (self time):")
+    for name, self_us, _, _ in sorted(entries, key=lambda e: -e[1])[:args.top]:
+        print(f"  {self_us / 1e3:9.1f} ms  {name}")
+
+    imported = {e[0].split(".")[0] for e in entries}
+    heavy = [name for name in HEAVY_MODULES if name in imported]
+    print(f"\nHeavy modules loaded at import: {', '.join(heavy) if heavy else 'none'}")
+    return 1 if heavy and args.strict else 0
+
+
+def profile_models(args):
+    import cv_service
+
+    start = perf_counter()
+    cv_service.load_models()
+    print(f"load_models: {perf_counter() - start:.3f}s (classifier: {cv_service.model_path or 'none'})")
+    cv_service.executor.shutdown()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service startup profile")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    imports_parser = subparsers.add_parser("imports", help="import time report of a module")
+    imports_parser.add_argument("module", nargs="?", default="cv_service")
+    imports_parser.add_argument("--path", default=".", help="directory the module is imported from")
+    imports_parser.add_argument("--top", type=int, default=10)
+    imports_parser.add_argument("--strict", action="store_true", help="fail if a heavy module is imported")
+    imports_parser.set_defaults(func=profile_imports)
+
+    models_parser = subparsers.add_parser("models", help="time the cv_service model load and warm-up")
+    models_parser.set_defaults(func=profile_models)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from trace_context import add_hop
+
+# Window to merge a burst of state changes into a single push (e.g. the four cards of a trick)
+STATE_PUSH_DELAY_MS = float(os.environ.get("GAME_STATE_PUSH_DELAY_MS", "50"))
+
+
+def diff_state(old: dict, new: dict) -> list:
+    """
+    JSON-patch style operations (add / replace / remove on top-level keys)
+    that turn old into new.
+    """
+    ops = []
+    for key, value in new.items():
+        if key not in old:
+            ops.append({"op": "add", "path": f"/{key}", "value": value})
+        elif old[key] != value:
+            ops.append({"op": "replace", "path": f"/{key}", "value": value})
+    for key in old:
+        if key not in new:
+            ops.append({"op": "remove", "path": f"/{key}"})
+    return ops
+
+
+class StateSender:
+    """
+    Long-lived sender of a game's state to the middleware.
+    push() only replaces the pending state; one worker thread sends the
+    latest pending state over a keep-alive requests.Session. Rapid changes
+    are coalesced and updates always arrive in the order they were pushed.
+
+    Each update has a monotonically increasing revision and only carries
+    the operations since the last acknowledged state:
+        {"revision": n, "base_revision": n - 1, "ops": [...]}
+    The first update, and any update after a failure or a 409 (middleware
+    at another revision), is a full snapshot:
+        {"revision": n, "full": true, "state": {...}}
+
+    One-off events (round_end) go through the same thread and session with
+    push_event(); they are never coalesced and are sent before the pending state.
+    """
+
+    def __init__(self, url: str, game_id: Optional[str] = None, delay_ms: float = STATE_PUSH_DELAY_MS,
+                 timeout: float = 1.0):
+        self.url = url
+        self.game_id = game_id  # sent with every update
+        self.delay = delay_ms / 1000
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.full_syncs = 0
+        self.revision = 0
+        self._acked_state = None  # last state the middleware applied
+        self._pending = None
+        self._events = []  # (url, payload) not sent yet
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"state-sender-{game_id}", daemon=True)
+        self._thread.start()
+
+    def push(self, state: dict):
+        """
+        Queues a state snapshot, replacing the one not sent yet (if any).
+        """
+        with self._condition:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = state
+            self._condition.notify()
+
+    def push_event(self, url: str, payload: dict):
+        """
+        Queues a one-off message for url (sent once, in order, never coalesced).
+        """
+        with self._condition:
+            self._events.append((url, payload))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._events and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                events, self._events = self._events, []
+                has_state = self._pending is not None
+            for url, payload in events:
+                self._send_event(url, payload)
+            if not has_state:
+                continue
+            # Let the rest of the burst arrive before sending
+            time.sleep(self.delay)
+            with self._condition:
+                state, self._pending = self._pending, None
+            if state is not None:
+                self._send(state)
+
+    def _full_update(self, state: dict) -> dict:
+        self.full_syncs += 1
+        return {"revision": self.revision, "full": True, "state": state}
+
+    def _send(self, state: dict):
+        trace = state.pop("trace", None)
+        if self._acked_state is not None:
+            ops = diff_state(self._acked_state, state)
+            if not ops:
+                return  # Nothing changed since the last update
+            self.revision += 1
+            update = {"revision": self.revision, "base_revision": self.revision - 1, "ops": ops}
+        else:
+            self.revision += 1
+            update = self._full_update(state)
+        if self.game_id is not None:
+            update["game_id"] = self.game_id
+        if trace is not None:
+            update["trace"] = add_hop(trace, "game_state_pushed")
+
+        try:
+            response = self.session.post(self.url, json=update, timeout=self.timeout)
+            if response.status_code == 409:
+                # Middleware is at another revision: resync with the full state
+                update = self._full_update(state)
+                if self.game_id is not None:
+                    update["game_id"] = self.game_id
+                if trace is not None:
+                    update["trace"] = trace
+                response = self.session.post(self.url, json=update, timeout=self.timeout)
+            response.raise_for_status()
+            self._acked_state = state
+            self.sent += 1
+            print(f"[SYNC] State revision {self.revision} pushed to middleware")
+        except requests.exceptions.RequestException as e:
+            # Unknown whether it was applied: the next update is a full snapshot
+            self._acked_state = None
+            self.failed += 1
+            print(f"[WARN] State sync failed: {e}")
+
+    def _send_event(self, url: str, payload: dict):
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            print(f"[SYNC] Event sent to {url}")
+        except requests.exceptions.RequestException as e:
+            self.failed += 1
+            print(f"[WARN] Failed to send event to {url}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "revision": self.revision,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "full_syncs": self.full_syncs,
+            "failed": self.failed
+        }
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.session.close()
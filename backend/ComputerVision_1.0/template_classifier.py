@@ -0,0 +1,106 @@
+import os
+
+import cv2
+import numpy as np
+
+from card_mapper import CardMapper
+from src.process import get_corner_snip, split_rank_suit
+from src.utils.Loader import Loader
+
+# Templates de ranks/naipes (assets/imgs/ranks/*.jpg e assets/imgs/suits/*.jpg)
+TEMPLATE_DIR = os.environ.get("CV_TEMPLATE_DIR", "./assets/imgs")
+# Diferença máxima (píxeis diferentes) para aceitar o melhor template, como no template_matching
+MAX_RANK_DIFF = 2300
+MAX_SUIT_DIFF = 1000
+# Tamanho da carta endireitada para que os templates foram recortados (src/process.py)
+CORNER_CARD_SIZE = (200, 300)
+
+
+def stack_templates(name_imgs):
+    """
+    Stacks NameImg templates into one contiguous (T, H*W) float32 array in [0, 1].
+    Returns (names, templates, pixel sums).
+    """
+    for name_img in name_imgs:
+        if name_img.img is None:
+            raise FileNotFoundError(f"Template não encontrado: {name_img.name}")
+    templates = np.stack([name_img.img for name_img in name_imgs]).reshape(len(name_imgs), -1)
+    templates = np.ascontiguousarray(templates, dtype=np.float32) / 255.0
+    return [name_img.name for name_img in name_imgs], templates, templates.sum(axis=1)
+
+
+def match_templates(queries, templates, template_sums):
+    """
+    Differences of every query against every template, in one matrix product.
+    queries are binary (0/1), so sum(|q - t|) = sum(q) + sum(t) - 2 q.t,
+    which is the np.sum(cv2.absdiff(...)) / 255 of template_matching.
+    Returns an (N, T) array.
+    """
+    return queries.sum(axis=1, keepdims=True) + template_sums - 2.0 * (queries @ templates.T)
+
+
+def extract_rank_suit(card):
+    """
+    Binary rank and suit crops from the corner of a flattened card, or None
+    if the corner does not have both.
+    """
+    card = cv2.resize(card, CORNER_CARD_SIZE)
+    corner, bin_img = get_corner_snip([card])[0]
+    parts = split_rank_suit(corner, bin_img)
+    if len(parts) != 2:
+        return None
+    return parts
+
+
+class TemplateClassifier:
+    """
+    CPU classifier that matches the card corner (rank + suit) against the
+    Loader templates. Used by cv_service when there are no YOLO weights.
+    Same interface as CardClassifier: classify_batch(images) -> [(label, conf)].
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR):
+        self.backend_name = "template"
+        # Só as ranks do baralho da sueca (sem 8, 9 e 10), as mesmas labels do YOLO
+        ranks = [name_img for name_img in Loader.load_ranks(os.path.join(template_dir, "ranks"))
+                 if name_img.name in CardMapper.RANKS]
+        self.rank_names, self.ranks, self.rank_sums = stack_templates(ranks)
+        self.suit_names, self.suits, self.suit_sums = stack_templates(
+            Loader.load_suits(os.path.join(template_dir, "suits")))
+        print(f"[Classifier] Templates carregados: {len(self.rank_names)} ranks, {len(self.suit_names)} naipes")
+
+    def classify(self, image):
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images):
+        # images = lista de cartas endireitadas (H,W,3); todos os templates comparados de uma vez
+        if len(images) == 0:
+            return []
+        found = []
+        rank_queries = np.zeros((len(images), self.ranks.shape[1]), np.float32)
+        suit_queries = np.zeros((len(images), self.suits.shape[1]), np.float32)
+        for i, image in enumerate(images):
+            parts = extract_rank_suit(image)
+            if parts is None:
+                continue
+            rank, suit = parts
+            rank_queries[len(found)] = rank.reshape(-1) > 0
+            suit_queries[len(found)] = suit.reshape(-1) > 0
+            found.append(i)
+
+        results = [(None, 0.0)] * len(images)
+        if not found:
+            return results
+        rank_diffs = match_templates(rank_queries[:len(found)], self.ranks, self.rank_sums)
+        suit_diffs = match_templates(suit_queries[:len(found)], self.suits, self.suit_sums)
+        for k, i in enumerate(found):
+            results[i] = self._best(rank_diffs[k], suit_diffs[k])
+        return results
+
+    def _best(self, rank_diffs, suit_diffs):
+        rank, suit = int(np.argmin(rank_diffs)), int(np.argmin(suit_diffs))
+        if rank_diffs[rank] >= MAX_RANK_DIFF or suit_diffs[suit] >= MAX_SUIT_DIFF:
+            return None, 0.0
+        # Confiança: fração de píxeis iguais ao template, no pior dos dois
+        conf = min(1.0 - rank_diffs[rank] / self.ranks.shape[1], 1.0 - suit_diffs[suit] / self.suits.shape[1])
+        return f"{self.rank_names[rank]}{self.suit_names[suit][0].lower()}", float(conf)
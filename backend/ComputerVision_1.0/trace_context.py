@@ -0,0 +1,27 @@
+import time
+from typing import Optional
+
+
+def now_ms() -> float:
+    # Wall clock: the services run on the same host, so hops are comparable
+    return round(time.time() * 1000, 1)
+
+
+def new_trace(trace_id: str, capture_ts_ms: Optional[int] = None) -> dict:
+    """
+    Trace context of a detection: an id and the ordered [hop, timestamp ms]
+    pairs it went through. The capture time comes from the phone's clock.
+    """
+    trace = {"trace_id": trace_id, "hops": []}
+    if capture_ts_ms:
+        trace["hops"].append(["capture", capture_ts_ms])
+    return trace
+
+
+def add_hop(trace: Optional[dict], hop: str, ts_ms: Optional[float] = None) -> Optional[dict]:
+    """
+    Appends a hop to the trace (no-op for requests without a trace).
+    """
+    if trace is not None:
+        trace["hops"].append([hop, ts_ms if ts_ms is not None else now_ms()])
+    return trace
@@ -1,26 +1,167 @@
-from ultralytics import YOLO
-import torch
+import ast
+import os
+import threading
+from functools import partial
+
+import cv2
+import numpy as np
+
+# Backend de inferência: "torch" (ultralytics), "onnx" ou "onnx_int8" (onnxruntime, sem torch),
+# ou "template" (template matching do canto da carta, sem pesos)
+CLASSIFIER_BACKEND = os.environ.get("CV_CLASSIFIER_BACKEND", "torch")
+IMGSZ = 224
+# Gate por frame; a confirmação final é feita por votação em vários frames (card_tracker)
+CONF_THRESHOLD = float(os.environ.get("CV_CONF_THRESHOLD", "0.80"))
+
+
+class TorchBackend:
+    """
+    Inferência com o modelo PyTorch do ultralytics.
+    """
 
-class CardClassifier:
     def __init__(self, model_path):
+        from ultralytics import YOLO
+        import torch
+
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"[Classifier] Carregando modelo YOLO em {device}...")
         self.model = YOLO(model_path)
         self.model.to(device)
-        
+        self.names = self.model.names
+
         # Warm-up
-        dummy = torch.zeros((1, 3, 224, 224)).to(device)
+        dummy = torch.zeros((1, 3, IMGSZ, IMGSZ)).to(device)
         print("[Classifier] Executando warm-up...")
         _ = self.model(dummy)
+
+    def predict(self, images):
+        # Devolve as probabilidades (N, num_classes)
+        results = self.model(list(images), imgsz=IMGSZ, verbose=False)
+        return np.stack([result.probs.data.cpu().numpy() for result in results])
+
+
+class OnnxBackend:
+    """
+    Inferência com onnxruntime (CPU). O modelo é exportado do .pt uma única
+    vez e guardado ao lado dos pesos (best.pt -> best.onnx).
+    Com quantized=True carrega a versão INT8 (best.int8.onnx), gerada com
+    `python classifier_tools.py quantize`.
+    """
+
+    def __init__(self, model_path, quantized=False):
+        import onnxruntime as ort
+
+        onnx_path = self.export(model_path) if model_path.endswith(".pt") else model_path
+        if quantized:
+            onnx_path = self.quantized_path(onnx_path)
+            if not os.path.exists(onnx_path):
+                raise FileNotFoundError(
+                    f"Modelo INT8 não encontrado: {onnx_path} (gerar com classifier_tools.py quantize)"
+                )
+        print(f"[Classifier] Carregando modelo ONNX: {onnx_path}")
+        self.session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+
+        # Warm-up
+        print("[Classifier] Executando warm-up...")
+        self.session.run(None, {self.input_name: np.zeros((1, 3, IMGSZ, IMGSZ), np.float32)})
+
+    @staticmethod
+    def export(model_path):
+        """
+        Exports the .pt weights to ONNX (dynamic batch) if the cached file is
+        missing or older than the weights. Returns the ONNX path.
+        """
+        onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+        if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(model_path):
+            return onnx_path
+
+        from ultralytics import YOLO
+        print(f"[Classifier] Exportando {model_path} para ONNX...")
+        return YOLO(model_path).export(format="onnx", imgsz=IMGSZ, dynamic=True)
+
+    @staticmethod
+    def quantized_path(onnx_path):
+        return os.path.splitext(onnx_path)[0] + ".int8.onnx"
+
+    @staticmethod
+    def preprocess(images):
+        # Igual ao classify_transforms do ultralytics:
+        # resize do lado menor para IMGSZ, center crop, BGR -> RGB, [0, 1]
+        batch = np.empty((len(images), 3, IMGSZ, IMGSZ), np.float32)
+        for k, image in enumerate(images):
+            h, w = image.shape[:2]
+            if h < w:
+                new_h, new_w = IMGSZ, int(IMGSZ * w / h)
+            else:
+                new_h, new_w = int(IMGSZ * h / w), IMGSZ
+            interpolation = cv2.INTER_AREA if min(h, w) > IMGSZ else cv2.INTER_LINEAR
+            resized = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+            top = int(round((new_h - IMGSZ) / 2.0))
+            left = int(round((new_w - IMGSZ) / 2.0))
+            crop = resized[top:top + IMGSZ, left:left + IMGSZ, ::-1]
+            batch[k] = crop.transpose(2, 0, 1)
+        batch *= 1 / 255.0
+        return batch
+
+    def predict(self, images):
+        # Devolve as probabilidades (N, num_classes); o modelo exportado já inclui o softmax
+        return self.session.run(None, {self.input_name: self.preprocess(images)})[0]
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+    "onnx_int8": partial(OnnxBackend, quantized=True),
+}
+
+
+class CardClassifier:
+    def __init__(self, model_path, backend=CLASSIFIER_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de classificação inválido: {backend}")
+        self.backend_name = backend
+        self.backend = BACKENDS[backend](model_path)
+        self.names = self.backend.names
+        # O predictor do ultralytics não é thread-safe (pool de threads do cv_service)
+        self._lock = threading.Lock()
         print("[Classifier] Modelo pronto!")
 
     def classify(self, image):
         # image = numpy array (H,W,3), shape ~224x224
-        results = self.model(image, imgsz=224, verbose=False)
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images):
+        # images = lista de numpy arrays (H,W,3); uma única inferência para todas as cartas
+        if len(images) == 0:
+            return []
+        with self._lock:
+            probs = self.backend.predict(images)
+        return [self._top1(p) for p in probs]
+
+    def _top1(self, probs):
         # Extrair label e confiança
-        if results and len(results) > 0:
-            class_label = results[0].names[results[0].probs.top1]
-            conf = results[0].probs.top1conf.item()
-            if conf >= 0.95:
-                return class_label, conf
-        return None, 0.0
\ No newline at end of file
+        top1 = int(np.argmax(probs))
+        conf = float(probs[top1])
+        if conf >= CONF_THRESHOLD:
+            return self.names[top1], conf
+        return None, 0.0
+
+
+def load_classifier(model_path, backend=CLASSIFIER_BACKEND):
+    """
+    CardClassifier for the YOLO weights, or the template matching classifier
+    when there are no weights (or backend is "template"). None if neither
+    is available (detection only).
+    """
+    if model_path is not None and backend != "template":
+        return CardClassifier(model_path=model_path, backend=backend)
+
+    from template_classifier import TemplateClassifier
+    try:
+        return TemplateClassifier()
+    except FileNotFoundError as e:
+        print(f"[Classifier] {e}. Só a deteção fica disponível.")
+        return None
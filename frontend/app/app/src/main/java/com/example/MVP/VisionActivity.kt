@@ -23,6 +23,8 @@ import androidx.core.content.ContextCompat
 import okhttp3.*
 import com.example.MVP.network.RetrofitClient
 import java.io.ByteArrayOutputStream
+import java.nio.ByteBuffer
+import okio.ByteString.Companion.toByteString
 import java.util.concurrent.Executors
 import androidx.appcompat.app.AlertDialog
 import org.json.JSONObject
@@ -49,6 +51,11 @@ class VisionActivity : AppCompatActivity() {
     private var resetRunnable: Runnable? = null
     private var lastWebSocketMessage: String? = null
 
+    // Binary frames: "SVF1" | seq (uint32) | capture timestamp ms (uint64) | JPEG
+    // Set to false to fall back to base64 text frames
+    private val useBinaryFrames = true
+    private var frameSeq = 0L
+
 
     override fun onCreate(savedInstanceState: Bundle?) {
         super.onCreate(savedInstanceState)
@@ -149,18 +156,29 @@ class VisionActivity : AppCompatActivity() {
         }, ContextCompat.getMainExecutor(this))
     }
 
-    // ------- CONVERTER FRAME -> JPEG -> BASE64 -------
+    // ------- CONVERTER FRAME -> JPEG -> BINARY (OU BASE64) -------
     private fun sendFrameToBackend(imageProxy: ImageProxy) {
+        val captureTs = System.currentTimeMillis()
         val bitmap = imageProxy.toBitmap() ?: return
 
         val output = ByteArrayOutputStream()
         bitmap.compress(Bitmap.CompressFormat.JPEG, 70, output)
-        val base64 = Base64.encodeToString(output.toByteArray(), Base64.NO_WRAP)
+        val jpeg = output.toByteArray()
 
         // Send frame via WebSocket to middleware
         if (::webSocket.isInitialized) {
             try {
-                webSocket.send(base64)
+                if (useBinaryFrames) {
+                    val header = ByteBuffer.allocate(16)
+                        .put("SVF1".toByteArray())
+                        .putInt((frameSeq and 0xFFFFFFFFL).toInt())
+                        .putLong(captureTs)
+                        .array()
+                    frameSeq++
+                    webSocket.send((header + jpeg).toByteString())
+                } else {
+                    webSocket.send(Base64.encodeToString(jpeg, Base64.NO_WRAP))
+                }
                 // Log less frequently to avoid spam
                 if (System.currentTimeMillis() % 1000 < 100) {
                     Log.d("VisionActivity", "Frame sent via WebSocket")
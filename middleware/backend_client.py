@@ -1,19 +1,20 @@
-import requests
+import httpx
 from typing import Optional
 from models import CardDetection
+from http_client import http_clients
 
 class BackendClient:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip("/")
 
-    def send_card(self, detection: CardDetection) -> Optional[dict]:
+    async def send_card(self, detection: CardDetection) -> Optional[dict]:
         """
         Sends a detected card to the backend.
         Returns backend response as dict, or None on failure.
         """
         try:
-            response = requests.post(
-                f"{self.base_url}/card",
+            response = await http_clients.get(self.base_url).post(
+                "/card",
                 json={
                     "rank": detection.rank,
                     "suit": detection.suit,
@@ -22,6 +23,6 @@ class BackendClient:
             )
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"[Middleware] Backend communication error: {e}")
             return None
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import os
+from bisect import bisect_right
+from typing import Optional
+
+import httpx
+
+from http_client import http_clients
+
+# CV service workers, comma-separated (e.g. "http://10.0.0.5:8001,http://10.0.0.6:8001")
+CV_SERVICE_URLS = [url.strip().rstrip("/") for url in
+                   os.environ.get("CV_SERVICE_URLS", "http://localhost:8001").split(",") if url.strip()]
+CV_HEALTH_INTERVAL_S = float(os.environ.get("CV_HEALTH_INTERVAL_S", "5"))
+# Consecutive failed health checks before a worker is taken out of the ring
+CV_HEALTH_FAILURES = int(os.environ.get("CV_HEALTH_FAILURES", "2"))
+# Streams per worker before new tables go to the next worker on the ring (0 = no limit)
+CV_MAX_STREAMS = int(os.environ.get("CV_MAX_STREAMS", "0"))
+
+
+def ring_hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes: adding or removing a worker
+    only moves the game_ids of the ring segments it takes or gives back.
+    """
+
+    def __init__(self, nodes=(), replicas: int = 100):
+        self.replicas = replicas
+        self._keys = []   # sorted virtual node hashes
+        self._nodes = {}  # virtual node hash -> node
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        for i in range(self.replicas):
+            key = ring_hash(f"{node}#{i}")
+            if key not in self._nodes:
+                self._nodes[key] = node
+                self._keys.insert(bisect_right(self._keys, key), key)
+
+    def remove(self, node: str):
+        self._keys = [key for key in self._keys if self._nodes[key] != node]
+        self._nodes = {key: n for key, n in self._nodes.items() if n != node}
+
+    def nodes_for(self, key: str) -> list:
+        """
+        Distinct nodes clockwise from the key's position (preferred first).
+        """
+        if not self._keys:
+            return []
+        start = bisect_right(self._keys, ring_hash(key))
+        nodes = []
+        for i in range(len(self._keys)):
+            node = self._nodes[self._keys[(start + i) % len(self._keys)]]
+            if node not in nodes:
+                nodes.append(node)
+        return nodes
+
+
+class CvWorker:
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True  # until the first health check says otherwise
+        self.ready = False  # models loaded (its /health says so)
+        self.failures = 0
+        self.load: dict = {}
+
+    @property
+    def ws_url(self) -> str:
+        return "ws" + self.url[len("http"):]
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.ready
+
+    @property
+    def streams(self) -> int:
+        return self.load.get("streams", 0)
+
+    def to_json(self) -> dict:
+        return {"url": self.url, "healthy": self.healthy, "ready": self.ready, "failures": self.failures,
+                "load": self.load}
+
+
+class CvWorkerPool:
+    """
+    The CV service workers the middleware spreads tables over.
+    A game_id goes to its first worker on the hash ring that is healthy and
+    ready (and below max_streams); workers are health-checked with their /health.
+    """
+
+    def __init__(self, urls=CV_SERVICE_URLS, max_streams: int = CV_MAX_STREAMS):
+        self.max_streams = max_streams
+        self.workers: dict[str, CvWorker] = {}
+        self.ring = HashRing()
+        for url in urls:
+            self.add_worker(url)
+
+    def add_worker(self, url: str) -> CvWorker:
+        url = url.rstrip("/")
+        if url not in self.workers:
+            self.workers[url] = CvWorker(url)
+            self.ring.add(url)
+        return self.workers[url]
+
+    def remove_worker(self, url: str) -> bool:
+        url = url.rstrip("/")
+        if self.workers.pop(url, None) is None:
+            return False
+        self.ring.remove(url)
+        return True
+
+    def place(self, game_id: str, current: Optional[str] = None, sticky: bool = True) -> Optional[CvWorker]:
+        """
+        Worker for the game: the first available worker on the ring below
+        max_streams (the game's own stream does not count on current).
+        With sticky, current (the game's worker) is kept while it is in the
+        pool and available, so a live game does not move when a worker is added;
+        rebalancing passes sticky=False at points where a move is safe.
+        """
+        worker = self.workers.get(current) if current is not None else None
+        if sticky and worker is not None and worker.available:
+            return worker
+        for url in self.ring.nodes_for(game_id):
+            worker = self.workers[url]
+            if not worker.available:
+                continue
+            if url == current or not self.max_streams or worker.streams < self.max_streams:
+                return worker
+        return None
+
+    def mark_failed(self, worker: CvWorker, error):
+        """
+        Takes a worker out of placement right away (e.g. a stream could not
+        connect); the health checks bring it back once it answers again.
+        """
+        worker.failures = max(worker.failures, CV_HEALTH_FAILURES)
+        if worker.healthy:
+            worker.healthy = False
+            print(f"[Middleware] CV worker {worker.url} marked unhealthy: {error}")
+
+    async def check(self, worker: CvWorker):
+        try:
+            response = await http_clients.get(worker.url).get("/health", timeout=1.0)
+            health = response.json()
+            if response.status_code != 200 or health.get("status") != "healthy":
+                raise ValueError(f"status {response.status_code}")
+            worker.load = health.get("load", {})
+            worker.failures = 0
+            if not worker.healthy:
+                print(f"[Middleware] CV worker {worker.url} is back")
+            worker.healthy = True
+            # Still loading its models is not a failure: it is only skipped by place()
+            worker.ready = health.get("ready", True)
+        except (httpx.HTTPError, ValueError) as e:
+            worker.failures += 1
+            if worker.failures >= CV_HEALTH_FAILURES:
+                self.mark_failed(worker, e)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(worker) for worker in list(self.workers.values())))
+
+    def to_json(self) -> list:
+        return [worker.to_json() for worker in self.workers.values()]
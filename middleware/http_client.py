@@ -0,0 +1,48 @@
+import os
+
+import httpx
+
+# Connection pool per service host (keep-alive, so calls reuse the TCP connection)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("MIDDLEWARE_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("MIDDLEWARE_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("MIDDLEWARE_HTTP_KEEPALIVE_EXPIRY", "30"))
+# Default timeouts (s); calls can pass a shorter timeout=
+HTTP_TIMEOUT = float(os.environ.get("MIDDLEWARE_HTTP_TIMEOUT", "5"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("MIDDLEWARE_HTTP_CONNECT_TIMEOUT", "2"))
+
+
+class HttpClients:
+    """
+    Shared async HTTP clients of the middleware, one httpx.AsyncClient per
+    service host: each host gets its own connection limits, so a slow
+    service cannot take the connections of the others.
+    """
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_keepalive=HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry=HTTP_KEEPALIVE_EXPIRY, timeout=HTTP_TIMEOUT, connect_timeout=HTTP_CONNECT_TIMEOUT):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        """
+        Pooled client for the given service (requests use paths relative to base_url).
+        """
+        base_url = base_url.rstrip("/")
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(base_url=base_url, limits=self.limits, timeout=self.timeout)
+            self._clients[base_url] = client
+        return client
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+http_clients = HttpClients()
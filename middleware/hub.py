@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+# Messages waiting per subscriber before the slow-subscriber policy kicks in
+HUB_QUEUE_SIZE = int(os.environ.get("MIDDLEWARE_HUB_QUEUE_SIZE", "32"))
+
+# Queue marker: the subscriber fell behind and gets a fresh full state instead
+RESYNC = None
+# Message type that a full state snapshot can replace
+STATE_TYPE = "state"
+
+
+class Subscriber:
+    """
+    One connected client of a game (phone, spectator, scoreboard display).
+    Messages are pre-serialized strings, queued as (type, text) in a bounded
+    queue and written by the subscriber's own task, so a slow client never
+    delays the others.
+    """
+
+    def __init__(self, game_id: str, queue_size: int = HUB_QUEUE_SIZE, types: Optional[set] = None):
+        self.game_id = game_id
+        self.types = types  # message types it wants (None = all)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    @property
+    def wants_state(self) -> bool:
+        return self.types is None or STATE_TYPE in self.types
+
+    def offer(self, text: str, kind: Optional[str] = None):
+        """
+        Queues a message of type kind without waiting. When the queue is full
+        the pending state messages are dropped and replaced by a single
+        resync (full state); events (e.g. round_end) are kept, and only the
+        oldest ones are dropped if events alone overflow the queue.
+        """
+        try:
+            self.queue.put_nowait((kind, text))
+            return
+        except asyncio.QueueFull:
+            pass
+
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        items.append((kind, text))
+        events = [item for item in items if item is not RESYNC and item[0] != STATE_TYPE]
+        self.dropped += len(items) - len(events)
+
+        room = self.queue.maxsize - (1 if self.wants_state else 0)
+        if len(events) > room:
+            self.dropped += len(events) - room
+            events = events[len(events) - room:]
+        for item in events:
+            self.queue.put_nowait(item)
+        if self.wants_state:
+            self.queue.put_nowait(RESYNC)
+
+
+class Hub:
+    """
+    Pub/sub of game messages keyed by game_id. publish() serializes each
+    message once and offers it to every subscriber of the game; snapshot
+    (game_id -> dict) builds the full-state message for new and lagging
+    subscribers.
+    """
+
+    def __init__(self, snapshot: Callable[[str], dict], queue_size: int = HUB_QUEUE_SIZE):
+        self.snapshot = snapshot
+        self.queue_size = queue_size
+        self.subscribers: dict[str, set] = {}
+        self.published = 0
+
+    def subscribe(self, game_id: str, types: Optional[set] = None) -> Subscriber:
+        subscriber = Subscriber(game_id, self.queue_size, types)
+        self.subscribers.setdefault(game_id, set()).add(subscriber)
+        if subscriber.wants_state:
+            subscriber.queue.put_nowait(RESYNC)  # Start with the full state
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self.subscribers.get(subscriber.game_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[subscriber.game_id]
+
+    def publish(self, game_id: Optional[str], message: dict) -> int:
+        """
+        Sends a message to the subscribers of game_id (of every game if None).
+        Returns the number of subscribers it was queued for.
+        """
+        text = json.dumps(message)
+        if game_id is None:
+            targets = [s for subscribers in self.subscribers.values() for s in subscribers]
+        else:
+            targets = list(self.subscribers.get(game_id, ()))
+        queued = 0
+        for subscriber in targets:
+            if subscriber.types is None or message.get("type") in subscriber.types:
+                subscriber.offer(text, message.get("type"))
+                queued += 1
+        self.published += 1
+        return queued
+
+    async def next_message(self, subscriber: Subscriber) -> str:
+        """
+        Waits for the subscriber's next serialized message.
+        """
+        item = await subscriber.queue.get()
+        if item is RESYNC:
+            return json.dumps(self.snapshot(subscriber.game_id))
+        return item[1]
+
+    async def run(self, subscriber: Subscriber, send: Callable[[str], Awaitable]):
+        """
+        Writes the subscriber's messages with send until it disconnects.
+        """
+        while True:
+            await send(await self.next_message(subscriber))
+
+    def stats(self) -> dict:
+        return {
+            "games": len(self.subscribers),
+            "subscribers": sum(len(s) for s in self.subscribers.values()),
+            "published": self.published,
+            "dropped": sum(s.dropped for subscribers in self.subscribers.values() for s in subscribers)
+        }
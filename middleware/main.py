@@ -1,16 +1,19 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import asyncio
-import requests
+import httpx
 import websockets
 import json
-import threading
-import subprocess
 
 from models import CardDetection, ScanEvent
 from backend_client import BackendClient
-from frontend_client import FrontendClient
+from tracing import FrameArrivals, add_hop, trace_writer, write_trace
+from http_client import http_clients
+from state_store import GameStateStore
+from hub import Hub
+from cv_pool import CvWorker, CvWorkerPool, CV_HEALTH_INTERVAL_S
 #from qrcode_generator import generate_qr_code
 
 # ---------- App ----------
@@ -18,23 +21,31 @@ from frontend_client import FrontendClient
 app = FastAPI(title="CV Middleware", version="0.1")
 
 backend = BackendClient(base_url="http://localhost:8002")
-frontend = FrontendClient(base_url="http://localhost:8000")
 
-latest_state: dict = {}
+# Authoritative, versioned state of each game (updated by game_service)
+DEFAULT_GAME_ID = "default"
+state_stores: dict[str, GameStateStore] = {}
 
-# Service URLs
-CV_SERVICE_URL = "http://localhost:8001"
-CV_SERVICE_WS_URL = "ws://localhost:8001"
-GAME_SERVICE_URL = "http://localhost:8002"
 
-#Device url
-DEVICE_SERVICE_URL = subprocess.getoutput("ip route get 1.1.1.1 | awk '{print $7}'")
+def get_state_store(game_id: str) -> GameStateStore:
+    if game_id not in state_stores:
+        state_stores[game_id] = GameStateStore()
+    return state_stores[game_id]
 
-#Device url as QR code
-#generate_qr_code(f"http://{DEVICE_SERVICE_URL}:8000")
 
-# Active WebSocket connections
-active_connections: dict[str, WebSocket] = {}
+# Pub/sub of state updates and round results to the connected clients of each game
+hub = Hub(snapshot=lambda game_id: {"type": "state", "game_id": game_id, **get_state_store(game_id).snapshot()})
+
+# Service URLs
+# CV workers (CV_SERVICE_URLS); each game_id is placed on one by consistent hashing
+cv_pool = CvWorkerPool()
+cv_assignments: dict[str, str] = {}  # game_id -> CV worker url
+# Labels the CV reported per game since its last reset, carried over when the game changes worker
+reported_labels: dict[str, set] = {}
+cv_stop_tasks: set = set()
+GAME_SERVICE_URL = "http://localhost:8002"
+
+# Active CV WebSocket connections
 cv_connections: dict[str, websockets.WebSocketClientProtocol] = {}
 
 # Suit name to symbol mapping for Game Service
@@ -72,7 +83,12 @@ class StartGameResponse(BaseModel):
     gameId: str
 
 
+class CvWorkerDTO(BaseModel):
+    url: str
+
+
 class RoundEndData(BaseModel):
+    game_id: Optional[str] = None
     round_number: int
     winner_team: int
     winner_points: int
@@ -81,23 +97,174 @@ class RoundEndData(BaseModel):
     game_ended: bool
 
 
+# ---------- CV Workers ----------
+
+def card_label(detection: dict) -> str:
+    """
+    CV label of a detection ("K" + "Clubs" -> "Kc").
+    """
+    return f"{detection['rank']}{detection['suit'][0].lower()}"
+
+
+async def stop_cv_game(url: str, game_id: str):
+    """
+    Drops the game's state on a worker it left (best effort: it may be down).
+    """
+    try:
+        await http_clients.get(url).post("/cv/stop", params={"game_id": game_id}, timeout=2)
+    except httpx.HTTPError as e:
+        print(f"[Middleware] Could not stop game {game_id} on {url}: {e}")
+
+
+async def start_cv_game(game_id: str, restart: bool = False, rebalance: bool = False) -> CvWorker:
+    """
+    Starts the game on its CV worker. With restart the CV state of the game
+    is always reset (new game); otherwise /cv/start is only sent when the
+    game is not on that worker yet, with the labels already reported so the
+    new worker does not report the cards on the table again.
+    With rebalance the game goes to its worker on the ring even if its
+    current one is healthy (e.g. a worker was added).
+    Unreachable workers are skipped (failover to the next one on the ring).
+    """
+    if restart:
+        reported_labels.pop(game_id, None)
+    while True:
+        current = cv_assignments.get(game_id)
+        worker = cv_pool.place(game_id, current, sticky=not rebalance)
+        if worker is None:
+            raise RuntimeError("No ready CV worker available")
+        if worker.url == current and not restart:
+            return worker
+        body = {"game_id": game_id, "sent_labels": sorted(reported_labels.get(game_id, ()))}
+        try:
+            response = await http_clients.get(worker.url).post("/cv/start", json=body, timeout=5)
+        except httpx.TransportError as e:
+            cv_pool.mark_failed(worker, e)
+            continue
+        if response.status_code == 503:
+            # Models still loading (the health check has not seen it yet): try the next worker
+            print(f"[Middleware] CV worker {worker.url} is still loading its models")
+            worker.ready = False
+            continue
+        response.raise_for_status()
+        cv_assignments[game_id] = worker.url
+        if current is not None and current != worker.url:
+            # In the background, so a hung old worker does not delay the failover
+            task = asyncio.create_task(stop_cv_game(current, game_id))
+            cv_stop_tasks.add(task)
+            task.add_done_callback(cv_stop_tasks.discard)
+        return worker
+
+
+async def connect_cv(game_id: str):
+    """
+    Opens the frame stream of the game to its CV worker.
+    """
+    while True:
+        worker = await start_cv_game(game_id)
+        try:
+            cv_ws = await websockets.connect(f"{worker.ws_url}/cv/stream/{game_id}")
+        except (OSError, websockets.InvalidHandshake) as e:
+            cv_pool.mark_failed(worker, e)
+            continue
+        cv_connections[game_id] = cv_ws
+        print(f"[Middleware] Connected to CV worker {worker.url} for game: {game_id}")
+        return cv_ws
+
+
+async def move_cv_game(game_id: str, rebalance: bool = False):
+    """
+    Starts a connected game on the worker place() now picks for it, if that
+    changed; closing the old CV connection makes the camera loop reconnect there.
+    """
+    current = cv_assignments.get(game_id)
+    worker = cv_pool.place(game_id, current, sticky=not rebalance)
+    if worker is None or worker.url == current:
+        return
+    print(f"[Middleware] Moving game {game_id} from {current} to {worker.url}")
+    try:
+        await start_cv_game(game_id, rebalance=rebalance)
+    except (httpx.HTTPError, RuntimeError) as e:
+        print(f"[Middleware] Could not move game {game_id}: {e}")
+        return
+    if game_id in cv_connections:
+        await cv_connections[game_id].close()
+
+
+async def rebalance_cv():
+    """
+    Moves the streams whose worker is gone (removed or unhealthy).
+    """
+    for game_id in list(cv_connections):
+        await move_cv_game(game_id)
+
+
+async def monitor_cv_workers():
+    while True:
+        await cv_pool.check_all()
+        await rebalance_cv()
+        await asyncio.sleep(CV_HEALTH_INTERVAL_S)
+
+
+# ---------- Lifecycle ----------
+
+@app.on_event("startup")
+async def start_cv_monitor():
+    """
+    Health-checks the CV workers in the background.
+    """
+    app.state.cv_monitor = asyncio.create_task(monitor_cv_workers())
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """
+    Closes the pooled connections to the other services and writes the
+    queued traces.
+    """
+    app.state.cv_monitor.cancel()
+    await http_clients.aclose()
+    await asyncio.to_thread(trace_writer.close)
+
+
 # ---------- Routes ----------
 
 @app.post("/game/state")
-def receive_state(state: dict):
-    global latest_state
-    latest_state = state
-    def push():
-        try:
-            frontend.send_state(latest_state)
-        except Exception as e:
-            print(f"[Middleware] Failed to push state to frontend: {e}")
-    threading.Thread(target=push, daemon=True).start()
-    return {"ok": True}
+async def receive_state(update: dict):
+    """
+    Receives a versioned state update from game_service: a delta
+    ({"revision", "base_revision", "ops"}) or a full snapshot
+    ({"revision", "full": true, "state"}). Replies 409 if a delta does not
+    apply to the current revision, so game_service resends the full state.
+    """
+    # Trace of the card that triggered this state push (if any)
+    trace = add_hop(update.pop("trace", None), "middleware_state_in")
+    game_id = update.pop("game_id", DEFAULT_GAME_ID)
+    state_store = get_state_store(game_id)
+    if "revision" not in update:
+        # Plain state dict (old format): treat as a full snapshot
+        update = {"revision": state_store.revision + 1, "full": True, "state": update}
+
+    result = state_store.apply(update)
+    if result == "conflict":
+        return JSONResponse(status_code=409, content={"ok": False, "revision": state_store.revision})
+
+    if result == "applied":
+        # Only the update goes out; subscribers that fall behind get a full resync
+        hub.publish(game_id, {"type": "state", "game_id": game_id, **update})
+        write_trace(add_hop(trace, "hub_published"), "state")
+    return {"ok": True, "revision": state_store.revision}
 
 @app.get("/game/state")
-def get_state():
-    return latest_state
+def get_state(game_id: str = DEFAULT_GAME_ID):
+    return get_state_store(game_id).state
+
+@app.get("/game/state/sync")
+def sync_state(game_id: str = DEFAULT_GAME_ID, since: Optional[int] = None):
+    """
+    Update from revision since to the current one (full snapshot without since).
+    """
+    return get_state_store(game_id).since(since)
 
 @app.post("/game/round_end")
 async def round_end(data: RoundEndData):
@@ -107,22 +274,20 @@ async def round_end(data: RoundEndData):
     """
     print(f"[MIDDLEWARE] Ronda {data.round_number} acabou! Equipa {data.winner_team} ganhou com {data.winner_points} pontos")
     
-    # Enviar para todos os clientes conectados
-    for game_id, ws in active_connections.items():
-        try:
-            message = {
-                "type": "round_end",
-                "round_number": data.round_number,
-                "winner_team": data.winner_team,
-                "winner_points": data.winner_points,
-                "team1_points": data.team1_points,
-                "team2_points": data.team2_points,
-                "game_ended": data.game_ended
-            }
-            await ws.send_text(json.dumps(message))
-            print(f"[MIDDLEWARE] Round end notification sent to game {game_id}")
-        except Exception as e:
-            print(f"[MIDDLEWARE] Failed to send round end to {game_id}: {e}")
+    # Enviar para todos os clientes conectados (cada um tem a sua fila, sem esperar pelos lentos)
+    message = {
+        "type": "round_end",
+        "round_number": data.round_number,
+        "winner_team": data.winner_team,
+        "winner_points": data.winner_points,
+        "team1_points": data.team1_points,
+        "team2_points": data.team2_points,
+        "game_ended": data.game_ended
+    }
+    if data.game_ended:
+        reported_labels.pop(data.game_id, None)
+    subscribers = hub.publish(data.game_id, message)
+    print(f"[MIDDLEWARE] Round end notification queued for {subscribers} clients")
     
     return {"success": True}
 
@@ -137,10 +302,13 @@ async def new_round(game_id: str):
         if game_id in cv_connections:
             cv_ws = cv_connections[game_id]
             await cv_ws.send(json.dumps(reset_message))
+            reported_labels.pop(game_id, None)
             print(f"[MIDDLEWARE] CV reset command sent for game {game_id}")
+            # No cards on the table: safe point to move the game to a worker added since it started
+            await move_cv_game(game_id, rebalance=True)
         
         # 2. Notificar game service para iniciar nova ronda
-        response = requests.post(f"{GAME_SERVICE_URL}/new_round", timeout=5)
+        response = await http_clients.get(GAME_SERVICE_URL).post(f"/games/{game_id}/new_round", timeout=5)
         if response.status_code == 200:
             return {"success": True, "message": "Nova ronda iniciada"}
         else:
@@ -155,26 +323,21 @@ async def start_game(request: StartGameRequest):
     Starts a new game with computer vision.
     Initializes the CV service.
     """
+    game_id = request.roomId or "default"
     try:
-        response = requests.post(
-            f"{CV_SERVICE_URL}/cv/start",
-            json={"game_id": request.roomId or "default"},
-            timeout=5
+        await start_cv_game(game_id, restart=True)
+        return StartGameResponse(
+            success=True,
+            message="Game started successfully",
+            gameId=game_id
         )
-        
-        if response.status_code == 200:
-            return StartGameResponse(
-                success=True,
-                message="Game started successfully",
-                gameId=request.roomId or "default"
-            )
-        else:
-            return StartGameResponse(
-                success=False,
-                message=f"Failed to start CV service: {response.text}",
-                gameId=""
-            )
-    except requests.RequestException as e:
+    except httpx.HTTPStatusError as e:
+        return StartGameResponse(
+            success=False,
+            message=f"Failed to start CV service: {e.response.text}",
+            gameId=""
+        )
+    except (httpx.HTTPError, RuntimeError) as e:
         print(f"[Middleware] Error starting CV service: {e}")
         return StartGameResponse(
             success=False,
@@ -194,7 +357,9 @@ async def game_ready(game_id: str):
         try:
             reset_command = json.dumps({"action": "reset_cards"})
             await cv_ws.send(reset_command)
+            reported_labels.pop(game_id, None)
             print(f"[Middleware] 🎮 Game started for {game_id} - CV history reset")
+            await move_cv_game(game_id, rebalance=True)
             return {"success": True, "message": "Game started, ready for cards"}
         except Exception as e:
             print(f"[Middleware] Error resetting CV: {e}")
@@ -210,18 +375,20 @@ async def websocket_camera(websocket: WebSocket, game_id: str):
     Forwards frames to CV service via WebSocket for continuous processing.
     """
     await websocket.accept()
-    active_connections[game_id] = websocket
     print(f"[Middleware] Mobile WebSocket connected for game: {game_id}")
+
+    # The app only handles round_end messages from the hub (state goes in the detections)
+    subscriber = hub.subscribe(game_id, types={"round_end"})
+    hub_task = asyncio.create_task(hub.run(subscriber, websocket.send_text))
     
     # Connect to CV Service via WebSocket
     cv_ws = None
+    frame_arrivals = FrameArrivals()
     try:
-        cv_ws = await websockets.connect(f"{CV_SERVICE_WS_URL}/cv/stream/{game_id}")
-        cv_connections[game_id] = cv_ws
-        print(f"[Middleware] Connected to CV Service WebSocket for game: {game_id}")
+        cv_ws = await connect_cv(game_id)
         
         # Create task to receive detections from CV service
-        async def receive_from_cv():
+        async def receive_from_cv(cv_ws):
             try:
                 async for message in cv_ws:
                     # Parse detection from CV
@@ -229,23 +396,33 @@ async def websocket_camera(websocket: WebSocket, game_id: str):
                     if data.get("success") and data.get("detection"):
                         detection = data["detection"]
                         print(f"[Middleware] Received detection from CV: {detection}")
+                        reported_labels.setdefault(game_id, set()).add(card_label(detection))
+
+                        # Latency trace: frame arrival here + this hop
+                        trace = detection.pop("trace", None)
+                        if trace is not None:
+                            trace["game_id"] = game_id
+                            frame_arrivals.annotate(trace, detection.get("frame_seq"))
+                            add_hop(trace, "middleware_detection_in")
                         
                         # Send to Game Service (Referee)
                         try:
                             # Convert suit name to symbol for Game Service
                             suit_symbol = SUIT_SYMBOLS.get(detection["suit"], detection["suit"])
                             
-                            game_response = requests.post(
-                                f"{GAME_SERVICE_URL}/card",
+                            game_response = await http_clients.get(GAME_SERVICE_URL).post(
+                                f"/games/{game_id}/card",
                                 json={
                                     "rank": detection["rank"],
                                     "suit": suit_symbol,  # Use symbol instead of name
-                                    "confidence": detection.get("confidence", 1.0)
+                                    "confidence": detection.get("confidence", 1.0),
+                                    "trace": trace
                                 },
                                 timeout=2
                             )
                             if game_response.status_code == 200:
                                 game_result = game_response.json()
+                                trace = add_hop(game_result.pop("trace", trace), "middleware_game_response")
                                 print(f"[Middleware] ✓ Game Service response: {game_result}")
                                 
                                 # Check if trump was just set
@@ -262,28 +439,47 @@ async def websocket_camera(websocket: WebSocket, game_id: str):
                                 print(f"[Middleware] ✗ Game Service HTTP {game_response.status_code}: {game_response.text}")
                                 # Still forward CV detection to mobile
                                 await websocket.send_json(data)
-                        except requests.exceptions.ConnectionError as e:
+                        except httpx.ConnectError as e:
                             print(f"[Middleware] ✗ Game Service not running at {GAME_SERVICE_URL}: {e}")
                             # Still forward CV detection to mobile
                             await websocket.send_json(data)
-                        except requests.RequestException as e:
+                        except httpx.HTTPError as e:
                             print(f"[Middleware] ✗ Error sending to Game Service: {e}")
                             # Still forward CV detection to mobile
                             await websocket.send_json(data)
+
+                        write_trace(add_hop(trace, "app_sent"), "detection")
                         
             except Exception as e:
                 print(f"[Middleware] Error receiving from CV: {e}")
         
         # Start receiving task
-        receive_task = asyncio.create_task(receive_from_cv())
+        receive_task = asyncio.create_task(receive_from_cv(cv_ws))
         
         # Forward frames from mobile to CV service
         while True:
-            # Receive base64 encoded frame from mobile
-            frame_data = await websocket.receive_text()
-            
-            # Forward frame to CV service via WebSocket
-            await cv_ws.send(frame_data)
+            # Receive frame from mobile: binary (header + JPEG/WebP) or base64 text
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            # Forward frame to CV service via WebSocket, keeping the frame type
+            if message.get("bytes") is not None:
+                frame_arrivals.record(message["bytes"])
+                frame = message["bytes"]
+            elif message.get("text") is not None:
+                frame = message["text"]
+            else:
+                continue
+
+            try:
+                await cv_ws.send(frame)
+            except websockets.ConnectionClosed:
+                # Worker failed or the game was moved: reconnect to its current worker
+                receive_task.cancel()
+                cv_ws = await connect_cv(game_id)
+                receive_task = asyncio.create_task(receive_from_cv(cv_ws))
+                await cv_ws.send(frame)
                 
     except WebSocketDisconnect:
         print(f"[Middleware] Mobile WebSocket disconnected for game: {game_id}")
@@ -291,17 +487,111 @@ async def websocket_camera(websocket: WebSocket, game_id: str):
         print(f"[Middleware] WebSocket error: {e}")
     finally:
         # Cleanup
-        if game_id in active_connections:
-            del active_connections[game_id]
+        hub_task.cancel()
+        hub.unsubscribe(subscriber)
         if cv_ws:
             await cv_ws.close()
+            receive_task.cancel()
         if game_id in cv_connections:
             del cv_connections[game_id]
+        # The next camera connection starts the game again (with the labels already reported)
+        cv_assignments.pop(game_id, None)
         print(f"[Middleware] Cleaned up connections for game: {game_id}")
 
 
+@app.websocket("/ws/game/{game_id}")
+async def websocket_game(websocket: WebSocket, game_id: str):
+    """
+    Live game updates for spectators and scoreboard displays: the full
+    state on connect, then state deltas and round_end messages.
+    """
+    await websocket.accept()
+    subscriber = hub.subscribe(game_id)
+    hub_task = asyncio.create_task(hub.run(subscriber, websocket.send_text))
+    try:
+        # Only used to notice the disconnect
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        hub_task.cancel()
+        hub.unsubscribe(subscriber)
+
+
+@app.get("/events/{game_id}")
+async def game_events(game_id: str):
+    """
+    Same stream as /ws/game/{game_id}, as Server-Sent Events.
+    """
+    subscriber = hub.subscribe(game_id)
+
+    async def stream():
+        try:
+            while True:
+                yield f"data: {await hub.next_message(subscriber)}\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/cv/workers")
+def list_cv_workers():
+    """
+    CV workers with their health, load and the games placed on them.
+    """
+    workers = cv_pool.to_json()
+    for worker in workers:
+        worker["games"] = [game_id for game_id, url in cv_assignments.items() if url == worker["url"]]
+    return workers
+
+
+@app.post("/cv/workers")
+async def add_cv_worker(request: CvWorkerDTO):
+    """
+    Adds a CV worker. New games whose ring position maps to it are placed
+    there; live games move to it on their next card reset (new round).
+    """
+    worker = cv_pool.add_worker(request.url)
+    await cv_pool.check(worker)
+    return {"success": True, "worker": worker.to_json()}
+
+
+@app.delete("/cv/workers")
+async def remove_cv_worker(url: str):
+    if not cv_pool.remove_worker(url):
+        return {"success": False, "message": "Worker not found"}
+    await rebalance_cv()
+    return {"success": True}
+
+
+@app.get("/health")
+def health_check():
+    """
+    Liveness check endpoint.
+    """
+    return {"status": "healthy"}
+
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness check endpoint: 503 while no CV worker is healthy and ready.
+    """
+    available = [worker.url for worker in cv_pool.workers.values() if worker.available]
+    if not available:
+        return JSONResponse(status_code=503, content={"ready": False, "cv_workers": []})
+    return {"ready": True, "cv_workers": available}
+
+
+@app.get("/hub/stats")
+def hub_stats():
+    return hub.stats()
+
+
 @app.post("/scan")
-def receive_scan(event: ScanEventDTO):
+async def receive_scan(event: ScanEventDTO):
     """
     Receives a card detection event and forwards it to the backend.
     """
@@ -318,7 +608,7 @@ def receive_scan(event: ScanEventDTO):
         confidence=event.detection.confidence
     )
 
-    backend_response = backend.send_card(detection)
+    backend_response = await backend.send_card(detection)
 
     if backend_response is None:
         return {
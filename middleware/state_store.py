@@ -0,0 +1,70 @@
+from collections import deque
+from typing import Optional
+
+
+def apply_patch(state: dict, ops: list):
+    """
+    Applies JSON-patch style operations on top-level keys (add / replace / remove).
+    """
+    for op in ops:
+        key = op["path"].lstrip("/")
+        if op["op"] == "remove":
+            state.pop(key, None)
+        else:
+            state[key] = op["value"]
+
+
+class GameStateStore:
+    """
+    Authoritative snapshot of the game state in the middleware.
+    game_service sends versioned updates (deltas on top of base_revision, or
+    full snapshots); the last history_size deltas are kept, so a client can
+    catch up from its revision with since() instead of a full resync.
+    """
+
+    def __init__(self, history_size: int = 64):
+        self.state: dict = {}
+        self.revision = 0
+        self._history = deque(maxlen=history_size)  # (revision, ops)
+
+    def apply(self, update: dict) -> str:
+        """
+        Applies an update. Returns "applied", "duplicate" (revision already
+        applied) or "conflict" (delta on top of another revision).
+        """
+        if update.get("full"):
+            if update["revision"] == self.revision and update["state"] == self.state:
+                return "duplicate"
+            # Full snapshots are otherwise always accepted (also after a game_service restart)
+            self.state = dict(update["state"])
+            self.revision = update["revision"]
+            self._history.clear()
+            return "applied"
+
+        if update["revision"] <= self.revision:
+            return "duplicate"
+        if update["base_revision"] != self.revision:
+            return "conflict"
+        apply_patch(self.state, update["ops"])
+        self.revision = update["revision"]
+        self._history.append((self.revision, update["ops"]))
+        return "applied"
+
+    def snapshot(self) -> dict:
+        return {"revision": self.revision, "full": True, "state": self.state}
+
+    def since(self, revision: Optional[int]) -> dict:
+        """
+        Update that brings a client from revision to the current one: the
+        merged deltas if they are still in the history, else a full snapshot.
+        """
+        if revision is None or revision > self.revision:
+            return self.snapshot()
+        missing = [(rev, ops) for rev, ops in self._history if rev > revision]
+        if len(missing) != self.revision - revision:
+            return self.snapshot()
+        return {
+            "revision": self.revision,
+            "base_revision": revision,
+            "ops": [op for _, ops in missing for op in ops]
+        }
@@ -0,0 +1,191 @@
+"""
+Card-to-referee latency traces.
+
+Every detection reported by the CV service carries a trace context
+({"trace_id", "hops": [[hop, timestamp ms], ...]}) that each service appends
+its hops to. The middleware writes finished traces to TRACE_FILE (JSON lines)
+and this module's CLI reports the p50/p99 time spent between hops:
+
+    python tracing.py report [--file card_traces.jsonl]
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "1") == "1"
+TRACE_FILE = os.environ.get("TRACE_FILE", "card_traces.jsonl")
+
+# Binary frame header of the app: "SVF1" | seq (uint32) | capture ts (uint64)
+FRAME_MAGIC = b"SVF1"
+
+
+def now_ms() -> float:
+    return round(time.time() * 1000, 1)
+
+
+def add_hop(trace: Optional[dict], hop: str, ts_ms: Optional[float] = None) -> Optional[dict]:
+    if trace is not None:
+        trace["hops"].append([hop, ts_ms if ts_ms is not None else now_ms()])
+    return trace
+
+
+class FrameArrivals:
+    """
+    Remembers when the middleware received the last frames of a stream
+    (by frame seq), so that a detection can be given its "middleware_frame_in"
+    hop without touching the forwarded bytes.
+    """
+
+    def __init__(self, max_frames: int = 256):
+        self.max_frames = max_frames
+        self._arrivals = OrderedDict()
+
+    def record(self, payload: bytes):
+        if not TRACE_ENABLED or payload[:4] != FRAME_MAGIC:
+            return
+        seq = int.from_bytes(payload[4:8], "big")
+        self._arrivals[seq] = now_ms()
+        if len(self._arrivals) > self.max_frames:
+            self._arrivals.popitem(last=False)
+
+    def annotate(self, trace: Optional[dict], seq: Optional[int]):
+        """
+        Inserts the frame arrival hop right after the capture hop.
+        """
+        if trace is None or seq not in self._arrivals:
+            return
+        hops = trace["hops"]
+        index = 1 if hops and hops[0][0] == "capture" else 0
+        hops.insert(index, ["middleware_frame_in", self._arrivals[seq]])
+
+
+class TraceWriter:
+    """
+    Appends trace records from a background thread, so the event loop never
+    does file I/O: records are queued and written in batches (one open() per
+    batch and file).
+    """
+
+    def __init__(self, max_batch: int = 256):
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, path: str, line: str):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put((path, line))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self._write([record for record in batch if record is not None])
+            if stop:
+                return
+
+    @staticmethod
+    def _write(records):
+        by_path = {}
+        for path, line in records:
+            by_path.setdefault(path, []).append(line)
+        for path, lines in by_path.items():
+            try:
+                with open(path, "a") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                print(f"[Middleware] Failed to write traces: {e}")
+
+    def close(self, timeout: float = 2.0):
+        """
+        Writes the queued records and stops the thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+trace_writer = TraceWriter()
+
+
+def write_trace(trace: Optional[dict], kind: str, path: str = TRACE_FILE):
+    """
+    Queues a finished trace for the trace file (written off the event loop).
+    kind = "detection" (path back to the app) or "state" (state push).
+    """
+    if not TRACE_ENABLED or trace is None:
+        return
+    trace_writer.put(path, json.dumps({"kind": kind, **trace}) + "\n")
+
+
+# ---------- Report ----------
+
+def load_traces(path: str) -> list:
+    traces = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                traces.append(json.loads(line))
+    return traces
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def hop_breakdown(traces: list) -> "OrderedDict[str, list]":
+    """
+    Durations (ms) of each hop-to-hop segment, plus the end-to-end total per
+    trace kind, in the order the segments first appear.
+    """
+    segments = OrderedDict()
+    for trace in traces:
+        hops = trace["hops"]
+        for (prev_hop, prev_ts), (hop, ts) in zip(hops, hops[1:]):
+            segments.setdefault(f"{prev_hop} -> {hop}", []).append(ts - prev_ts)
+        if len(hops) >= 2:
+            total = f"total ({trace.get('kind', 'detection')}: {hops[0][0]} -> {hops[-1][0]})"
+            segments.setdefault(total, []).append(hops[-1][1] - hops[0][1])
+    return segments
+
+
+def report(path: str):
+    traces = load_traces(path)
+    print(f"{len(traces)} traces from {path}")
+    print(f"{'segment':<60} {'n':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for segment, durations in hop_breakdown(traces).items():
+        print(f"{segment:<60} {len(durations):>6} "
+              f"{percentile(durations, 50):>9.1f} {percentile(durations, 99):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Card-to-referee latency traces")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="p50/p99 per hop")
+    report_parser.add_argument("--file", default=TRACE_FILE)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(args.file)
+
+
+if __name__ == "__main__":
+    main()